@@ -2,15 +2,14 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import io
 import os
 import sys
-import shutil
 import tempfile
+from pathlib import Path
 from typing import Optional
 
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font
-from openpyxl.utils import get_column_letter
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.error import TelegramError
 from telegram.ext import (
@@ -24,6 +23,11 @@ from telegram.ext import (
 from lottery_bot.keyboards import admin_menu_keyboard
 from lottery_bot.storage import StorageManager
 
+# Admin input state lives in ``context.user_data``:
+# - "_active_mode": the single active free-input flow routed by admin_active_mode_router
+#   ("broadcast", "start_edit" or "game_info_edit"); absent when idle.
+# - "subscription_mode" / "settings_mode": inputs consumed by their own handler groups.
+
 
 def register_admin_handlers(application) -> None:
     """Register admin command, message, and callback handlers."""
@@ -106,6 +110,47 @@ def register_admin_handlers(application) -> None:
     application.add_handler(mode_router_handler, group=7)
 
 
+_BROADCAST_CONCURRENCY = 25
+_BROADCAST_RATE = 30  # messages per second, Telegram's global bot limit
+_BROADCAST_PROGRESS_EVERY = 500
+
+
+# Static inline keyboards are immutable, so build them once and share them.
+_CANCEL_BROADCAST_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Bekor qilish", callback_data="cancel_broadcast")]]
+)
+_CANCEL_START_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Bekor qilish", callback_data="cancel_start_message")]]
+)
+_GAME_INFO_EDIT_KB = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("♻️ Standart holatga qaytarish", callback_data="reset_game_info_message")],
+        [InlineKeyboardButton("Bekor qilish", callback_data="cancel_game_info_message")],
+    ]
+)
+_CANCEL_SETTINGS_INPUT_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Bekor qilish", callback_data="settings:cancel_input")]]
+)
+_CANCEL_RESTORE_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("❌ Bekor qilish", callback_data="settings:cancel_input")]]
+)
+_CANCEL_SUBSCRIPTION_INPUT_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Bekor qilish", callback_data="subscription:cancel_input")]]
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _manager_contact_keyboard(manager_contact: str) -> InlineKeyboardMarkup:
+    """Button linking a rejected user to the manager's Telegram profile."""
+    contact_username = manager_contact.lstrip("@") or "menejer_1w"
+    contact_url = f"https://t.me/{contact_username}"
+    return InlineKeyboardMarkup([[InlineKeyboardButton("admin bilan bog'lanish", url=contact_url)]])
+
+
+def _storage(context: CallbackContext) -> StorageManager:
+    return context.application.bot_data["storage"]
+
+
 def _format_money(value: int | float) -> str:
     return f"{value:,.0f}".replace(",", " ")
 
@@ -142,12 +187,13 @@ def _subscription_management_keyboard(enabled: bool, has_channels: bool, channel
     toggle_icon = "🟢" if enabled else "🔴"
     status = "Yoqilgan" if enabled else "O'chirilgan"
     toggle_text = f"{toggle_icon} Obuna: {status}"
+    remove_cb = "subscription:prompt_remove" if has_channels else "subscription:no_channels"
     
     buttons = [
         [InlineKeyboardButton(toggle_text, callback_data="subscription:toggle")],
         [
             InlineKeyboardButton("➕ Kanal qo'shish", callback_data="subscription:add"),
-            InlineKeyboardButton(f"🗑 O'chirish ({channels_count})", callback_data="subscription:prompt_remove" if has_channels else "subscription:no_channels"),
+            InlineKeyboardButton(f"🗑 O'chirish ({channels_count})", callback_data=remove_cb),
         ],
         [
             InlineKeyboardButton("📋 Ro'yxat", callback_data="subscription:list"),
@@ -259,7 +305,7 @@ async def _refresh_subscription_message_from_ref(
     if not ref:
         return
     chat_id, message_id = ref
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     summary, keyboard = _build_subscription_summary(config, notice=notice)
     try:
@@ -286,7 +332,7 @@ async def admin_home(update: Update, context: CallbackContext) -> None:
 
 async def admin_home_dashboard(update: Update, context: CallbackContext) -> None:
     """Show admin dashboard with quick stats."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     stats = await storage.get_detailed_stats()
     
     progress = int((stats['tickets_sold'] / stats['total_tickets']) * 100) if stats['total_tickets'] > 0 else 0
@@ -322,7 +368,7 @@ Sotilgan: {stats['tickets_sold']} / {stats['total_tickets']}
 
 async def admin_pending_payments(update: Update, context: CallbackContext) -> None:
     """Show pending payments list with pagination."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     pending = await storage.list_pending()
     
     if not pending:
@@ -389,7 +435,7 @@ async def admin_pending_page(update: Update, context: CallbackContext) -> None:
     parts = query.data.split(":")
     page = int(parts[2]) if len(parts) > 2 else 0
     
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     pending = await storage.list_pending()
     
     if not pending:
@@ -417,7 +463,7 @@ async def admin_pending_close(update: Update, context: CallbackContext) -> None:
 
 async def admin_users_list(update: Update, context: CallbackContext) -> None:
     """Show users list with pagination."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     users = await storage.list_all_users()
     
     if not users:
@@ -482,7 +528,7 @@ async def admin_users_page(update: Update, context: CallbackContext) -> None:
     parts = query.data.split(":")
     page = int(parts[2]) if len(parts) > 2 else 0
     
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     users = await storage.list_all_users()
     
     if not users:
@@ -511,7 +557,7 @@ async def admin_users_close(update: Update, context: CallbackContext) -> None:
 
 async def admin_stats(update: Update, context: CallbackContext) -> None:
     """Deliver detailed analytics for the admin."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     stats = await storage.get_detailed_stats()
     
     # Progress bar
@@ -574,7 +620,7 @@ async def admin_stats(update: Update, context: CallbackContext) -> None:
 
 async def admin_list_approved(update: Update, context: CallbackContext) -> None:
     """List approved purchases with an option to cancel them."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     approved = await storage.list_approved()
     text, markup = _build_approved_summary(approved)
     await update.message.reply_text(text, reply_markup=markup or admin_menu_keyboard())
@@ -582,7 +628,7 @@ async def admin_list_approved(update: Update, context: CallbackContext) -> None:
 
 async def admin_subscription_entry(update: Update, context: CallbackContext) -> None:
     """Open the subscription management popup."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     summary, keyboard = _build_subscription_summary(config)
     sent = await update.message.reply_text(summary, reply_markup=keyboard)
@@ -591,7 +637,7 @@ async def admin_subscription_entry(update: Update, context: CallbackContext) ->
 
 async def admin_settings_entry(update: Update, context: CallbackContext) -> None:
     """Show bot settings actions."""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     card_number = await storage.get_card_number()
     manager_contact = await storage.get_manager_contact()
     text = (
@@ -604,7 +650,7 @@ async def admin_settings_entry(update: Update, context: CallbackContext) -> None
 
 
 async def _edit_subscription_menu(query, context: CallbackContext, notice: Optional[str] = None) -> None:
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     summary, keyboard = _build_subscription_summary(config, notice=notice)
     try:
@@ -636,6 +682,8 @@ async def admin_settings_restart(update: Update, context: CallbackContext) -> No
     query = update.callback_query
     await query.answer("Bot qayta ishga tushirilmoqda...", show_alert=True)
     await query.edit_message_text("🔄 Bot qayta ishga tushirilmoqda...")
+    # execl skips post_shutdown, so write out debounced and journaled changes first.
+    await _storage(context).flush()
     # Restart current process.
     os.execl(sys.executable, sys.executable, *sys.argv)
 
@@ -645,11 +693,7 @@ async def admin_settings_backup(update: Update, context: CallbackContext) -> Non
     query = update.callback_query
     await query.answer("💾 Zaxira nusxa tayyorlanmoqda...")
     
-    storage: StorageManager = context.application.bot_data["storage"]
-    src_path = getattr(storage, "_path", None)
-    if not src_path or not os.path.exists(src_path):
-        await query.answer("Backup uchun fayl topilmadi.", show_alert=True)
-        return
+    storage = _storage(context)
 
     from datetime import datetime
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -657,8 +701,9 @@ async def admin_settings_backup(update: Update, context: CallbackContext) -> Non
     
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
     try:
-        shutil.copy(src_path, temp_file.name)
         temp_file.close()
+        # Built from memory with the history logs folded in, so it is current and self-contained.
+        await storage.write_backup(Path(temp_file.name))
         
         # Get stats for caption
         stats = await storage.get_detailed_stats()
@@ -710,9 +755,7 @@ async def admin_settings_restore(update: Update, context: CallbackContext) -> No
             "Bekor qilish uchun tugmadan foydalaning."
         ),
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("❌ Bekor qilish", callback_data="settings:cancel_input")]]
-        ),
+        reply_markup=_CANCEL_RESTORE_KB,
     )
 
 
@@ -721,7 +764,7 @@ async def admin_settings_clear_data(update: Update, context: CallbackContext) ->
     query = update.callback_query
     await query.answer()
     
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     stats = await storage.get_detailed_stats()
     
     await query.edit_message_text(
@@ -749,7 +792,7 @@ async def admin_settings_clear_confirm(update: Update, context: CallbackContext)
     query = update.callback_query
     await query.answer("🗑 Baza tozalanmoqda...", show_alert=True)
     
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     
     try:
         await storage.reset_all_data()
@@ -805,7 +848,7 @@ async def admin_settings_handle_restore(update: Update, context: CallbackContext
             return
         
         # Restore data
-        storage: StorageManager = context.application.bot_data["storage"]
+        storage = _storage(context)
         await storage.restore_from_backup(temp_file.name)
         
         context.user_data.pop("settings_mode", None)
@@ -843,9 +886,7 @@ async def admin_settings_change_card(update: Update, context: CallbackContext) -
             "Misol: 9860 1234 5678 9012\n"
             "Bekor qilish uchun tugmadan foydalaning."
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Bekor qilish", callback_data="settings:cancel_input")]]
-        ),
+        reply_markup=_CANCEL_SETTINGS_INPUT_KB,
     )
 
 
@@ -858,16 +899,14 @@ async def admin_settings_change_manager(update: Update, context: CallbackContext
         text=(
             "👤 Yangi menejer username ni yuboring.\n"
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Bekor qilish", callback_data="settings:cancel_input")]]
-        ),
+        reply_markup=_CANCEL_SETTINGS_INPUT_KB,
     )
 
 
 async def admin_subscription_toggle(update: Update, context: CallbackContext) -> None:
     """Toggle mandatory subscription state."""
     query = update.callback_query
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     new_state = not config.get("enabled", False)
     await storage.set_subscription_enabled(new_state)
@@ -899,9 +938,7 @@ async def admin_subscription_add(update: Update, context: CallbackContext) -> No
             "➕ Kanal qo'shish uchun kanal username yoki havolasini yuboring, yoki kanaldan xabarni "
             "forward qiling. Bekor qilish uchun tugmadan foydalaning."
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Bekor qilish", callback_data="subscription:cancel_input")]]
-        ),
+        reply_markup=_CANCEL_SUBSCRIPTION_INPUT_KB,
     )
 
 
@@ -909,7 +946,7 @@ async def admin_subscription_prompt_remove(update: Update, context: CallbackCont
     """Show removable channels."""
     query = update.callback_query
     await query.answer()
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     channels = config.get("channels", [])
     if not channels:
@@ -946,7 +983,7 @@ async def admin_subscription_remove(update: Update, context: CallbackContext) ->
     query = update.callback_query
     parts = query.data.split(":", maxsplit=2)
     channel_id = parts[2] if len(parts) > 2 else ""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     removed = await storage.remove_subscription_channel(channel_id)
     notice = "✅ Kanal o'chirildi." if removed else "ℹ️ Kanal topilmadi."
     await _edit_subscription_menu(query, context, notice=notice)
@@ -960,7 +997,7 @@ async def admin_subscription_edit_message(update: Update, context: CallbackConte
     context.user_data["subscription_mode"] = "edit_message"
     if query.message:
         _set_subscription_message_ref(context, query.message.chat_id, query.message.message_id)
-    current = await context.application.bot_data["storage"].get_subscription_message()
+    current = await _storage(context).get_subscription_message()
     await context.bot.send_message(
         chat_id=query.message.chat_id,
         text=(
@@ -1016,7 +1053,7 @@ async def admin_subscription_text_input(update: Update, context: CallbackContext
     if not mode:
         return
 
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
 
     if mode == "add":
         channel = await _resolve_channel(update, context)
@@ -1054,7 +1091,7 @@ async def admin_settings_text_input(update: Update, context: CallbackContext) ->
         if not card:
             await update.message.reply_text("❗ Karta raqami bo'sh bo'lmasligi kerak.")
             return
-        storage: StorageManager = context.application.bot_data["storage"]
+        storage = _storage(context)
         await storage.set_card_number(card)
         context.user_data.pop("settings_mode", None)
         await update.message.reply_text(
@@ -1072,7 +1109,7 @@ async def admin_settings_text_input(update: Update, context: CallbackContext) ->
             return
         if not contact.startswith("@"):  # normalize
             contact = "@" + contact
-        storage: StorageManager = context.application.bot_data["storage"]
+        storage = _storage(context)
         await storage.set_manager_contact(contact)
         context.user_data.pop("settings_mode", None)
         await update.message.reply_text(
@@ -1099,7 +1136,7 @@ async def admin_settings_cancel_input(update: Update, context: CallbackContext)
 async def admin_subscription_list(update: Update, context: CallbackContext) -> None:
     """Send the current channel list in chat."""
     query = update.callback_query
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     channels = config.get("channels", [])
     if not channels:
@@ -1122,7 +1159,7 @@ async def admin_subscription_list(update: Update, context: CallbackContext) -> N
 async def admin_subscription_invite_link(update: Update, context: CallbackContext) -> None:
     """Show invite links for all channels."""
     query = update.callback_query
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     channels = config.get("channels", [])
     
@@ -1151,7 +1188,7 @@ async def admin_subscription_invite_link(update: Update, context: CallbackContex
 async def admin_subscription_preview(update: Update, context: CallbackContext) -> None:
     """Show a preview of the subscription check message as users see it."""
     query = update.callback_query
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     config = await storage.get_subscription_config()
     channels = config.get("channels", [])
     custom_message = config.get("message", "")
@@ -1217,7 +1254,7 @@ async def admin_cancel_approved(update: Update, context: CallbackContext) -> Non
     query = update.callback_query
     parts = query.data.split(":", maxsplit=2)
     purchase_id = parts[2] if len(parts) > 2 else ""
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     purchase = await storage.cancel_approved_purchase(purchase_id)
     if not purchase:
         await query.answer("Topilmadi yoki allaqachon bekor qilingan.", show_alert=True)
@@ -1225,7 +1262,7 @@ async def admin_cancel_approved(update: Update, context: CallbackContext) -> Non
 
     tickets = purchase.get("tickets", [])
     amount = _format_money(purchase.get("amount", 0))
-    ticket_list = ", ".join(str(t) for t in sorted(tickets)) if tickets else "-"
+    ticket_list = ", ".join(map(str, tickets)) if tickets else "-"
 
     await query.answer("Bekor qilindi", show_alert=True)
 
@@ -1265,84 +1302,116 @@ async def admin_cancel_approved(update: Update, context: CallbackContext) -> Non
             pass
 
 
+_EXPORT_HEADERS = [
+    "Purchase ID",
+    "Foydalanuvchi",
+    "Username",
+    "Telefon",
+    "Chipta soni",
+    "Chipta raqamlari",
+    "To'lov (so'm)",
+    "Tasdiqlangan vaqt",
+]
+_EXPORT_WIDTHS = [18, 22, 18, 16, 14, 28, 16, 26]
+_EXPORT_CENTER_COLS = {1, 5, 7, 8}
+
+# Last rendered export as (storage.approved_version, xlsx bytes).
+_export_cache: Optional[tuple[int, bytes]] = None
+_export_lock = asyncio.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _pyexcelerate():
+    """Import PyExcelerate on first export; it is only needed for that rare action."""
+    import pyexcelerate
+
+    return pyexcelerate
+
+
+@functools.lru_cache(maxsize=1)
+def _export_styles():
+    """Return the shared (header row, per-column) styles for the Excel export."""
+    px = _pyexcelerate()
+    center = px.Alignment(horizontal="center", vertical="center")
+    header_style = px.Style(font=px.Font(bold=True), alignment=center, size=22)
+    # Only the numeric/ID columns need centring; the rest keep default alignment.
+    column_styles = [
+        px.Style(size=width, alignment=center) if idx in _EXPORT_CENTER_COLS else px.Style(size=width)
+        for idx, width in enumerate(_EXPORT_WIDTHS, start=1)
+    ]
+    return header_style, column_styles
+
+
+def _build_export_workbook(columns) -> bytes:
+    """Render the approved-purchases export to xlsx bytes."""
+    ticket_strs = [", ".join(map(str, tickets)) for tickets in columns["tickets"]]
+    usernames = [f"@{username}" if username else "" for username in columns["username"]]
+    phones = [phone or "" for phone in columns["phone_number"]]
+    resolved = [value or "" for value in columns["resolved_at"]]
+    data = [_EXPORT_HEADERS]
+    data.extend(
+        zip(
+            columns["purchase_id"],
+            columns["full_name"],
+            usernames,
+            phones,
+            columns["quantity"],
+            ticket_strs,
+            columns["amount"],
+            resolved,
+        )
+    )
+
+    # Styles are applied per row/column rather than per cell; widths and
+    # alignment ride on the column styles, the header row overrides them.
+    header_style, column_styles = _export_styles()
+    workbook = _pyexcelerate().Workbook()
+    sheet = workbook.new_sheet("Chiptalar", data=data)
+    sheet.set_row_style(1, header_style)
+    for idx, style in enumerate(column_styles, start=1):
+        sheet.set_col_style(idx, style)
+
+    # PyExcelerate's public API has no compression setting, so the export keeps the default
+    # deflate level; lowering it would mean driving the library's private writer.
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
 async def admin_export_excel(update: Update, context: CallbackContext) -> None:
     """Generate and send an Excel report of approved purchases."""
-    storage: StorageManager = context.application.bot_data["storage"]
-    rows = await storage.get_ticket_export_rows()
-    if not rows:
-        await update.message.reply_text(
-            "📭 Hozircha eksport qilish uchun tasdiqlangan to'lovlar yo'q.",
-            reply_markup=admin_menu_keyboard(),
-        )
-        return
+    global _export_cache
 
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Chiptalar"
-    headers = [
-        "Purchase ID",
-        "Foydalanuvchi",
-        "Username",
-        "Telefon",
-        "Chipta soni",
-        "Chipta raqamlari",
-        "To'lov (so'm)",
-        "Tasdiqlangan vaqt",
-    ]
-    sheet.append(headers)
-
-    header_font = Font(bold=True)
-    header_align = Alignment(horizontal="center", vertical="center")
-    sheet.row_dimensions[1].height = 22
-    for col_idx, _ in enumerate(headers, start=1):
-        cell = sheet.cell(row=1, column=col_idx)
-        cell.font = header_font
-        cell.alignment = header_align
-
-    # Wider, clearer columns
-    widths = [18, 22, 18, 16, 14, 28, 16, 26]
-    for idx, width in enumerate(widths, start=1):
-        sheet.column_dimensions[get_column_letter(idx)].width = width
-
-    for row in rows:
-        tickets = ", ".join(str(ticket) for ticket in sorted(row.get("tickets", [])))
-        sheet.append(
-            [
-                row.get("purchase_id"),
-                row.get("full_name"),
-                ("@" + row["username"]) if row.get("username") else "",
-                row.get("phone_number") or "",
-                row.get("quantity", 0),
-                tickets,
-                row.get("amount", 0),
-                row.get("resolved_at") or "",
-            ]
-        )
+    storage = _storage(context)
+    async with _export_lock:
+        version = storage.approved_version
+        if _export_cache is not None and _export_cache[0] == version:
+            payload = _export_cache[1]
+        else:
+            columns = await storage.get_ticket_export_columns()
+            if not columns["purchase_id"]:
+                await update.message.reply_text(
+                    "📭 Hozircha eksport qilish uchun tasdiqlangan to'lovlar yo'q.",
+                    reply_markup=admin_menu_keyboard(),
+                )
+                return
+            payload = _build_export_workbook(columns)
+            _export_cache = (version, payload)
+
+    await update.message.reply_document(
+        document=io.BytesIO(payload),
+        filename="lottery_export.xlsx",
+        caption="📥 Tasdiqlangan chiptalar bo'yicha hisobot tayyor.",
+    )
 
-    # Align text for readability
-    center_cols = {1, 5, 7, 8}
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=2, max_row=sheet.max_row), start=2):
-        for col_idx, cell in enumerate(row, start=1):
-            if col_idx in center_cols:
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-            else:
-                cell.alignment = Alignment(vertical="center")
 
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+async def _suppress_telegram_error(coro) -> None:
+    """Await a notification, ignoring delivery failures so sibling sends still run."""
     try:
-        workbook.save(temp_file.name)
-        temp_file.close()
-        with open(temp_file.name, "rb") as handle:
-            await update.message.reply_document(
-                document=handle,
-                filename="lottery_export.xlsx",
-                caption="📥 Tasdiqlangan chiptalar bo'yicha hisobot tayyor.",
-            )
-    finally:
-        try:
-            os.remove(temp_file.name)
-        except OSError:
-            pass
+        await coro
+    except TelegramError:
+        pass
+
 
 async def admin_decision(update: Update, context: CallbackContext) -> None:
     """Handle approval or rejection callbacks."""
@@ -1355,7 +1424,7 @@ async def admin_decision(update: Update, context: CallbackContext) -> None:
         return
 
     action, purchase_id = query.data.split(":", maxsplit=1)
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
 
     if not await storage.is_pending(purchase_id):
         await _edit_admin_message(query, "ℹ️ Bu chek allaqachon ko'rib chiqilgan.")
@@ -1367,26 +1436,33 @@ async def admin_decision(update: Update, context: CallbackContext) -> None:
             await query.answer(text="Yetarli chipta qolmadi yoki purchase topilmadi.", show_alert=True)
             return
 
-        ticket_list = ", ".join(str(t) for t in sorted(tickets))
+        ticket_list = ", ".join(map(str, tickets))
         amount = _format_money(purchase.get("amount", 0))
 
-        await _edit_admin_message(
-            query,
-            f"✅ Tasdiqlandi\n🎟 Chiptalar: {ticket_list}\n💰 To'lov: {amount} so'm",
-        )
-
-        await context.bot.send_message(
-            chat_id=purchase["user_id"],
-            text=(
-                "🎉 Tabriklaymiz! To'lovingiz muvaffaqiyatli tasdiqlandi.\n"
-                f"🎟 Sizga biriktirilgan chiptalar: {ticket_list}\n"
-                "🙏 Ishtirokingiz uchun rahmat, omad yor bo'lsin!"
+        await asyncio.gather(
+            _suppress_telegram_error(
+                _edit_admin_message(
+                    query,
+                    f"✅ Tasdiqlandi\n🎟 Chiptalar: {ticket_list}\n💰 To'lov: {amount} so'm",
+                    _admin_card_kind(purchase),
+                )
+            ),
+            _suppress_telegram_error(
+                context.bot.send_message(
+                    chat_id=purchase["user_id"],
+                    text=(
+                        "🎉 Tabriklaymiz! To'lovingiz muvaffaqiyatli tasdiqlandi.\n"
+                        f"🎟 Sizga biriktirilgan chiptalar: {ticket_list}\n"
+                        "🙏 Ishtirokingiz uchun rahmat, omad yor bo'lsin!"
+                    ),
+                )
+            ),
+            _suppress_telegram_error(
+                context.bot.send_message(
+                    chat_id=settings.admin_id,
+                    text=f"✅ Tasdiqlandi: {purchase['full_name']} — {ticket_list} (💰 {amount} so'm)",
+                )
             ),
-        )
-
-        await context.bot.send_message(
-            chat_id=settings.admin_id,
-            text=f"✅ Tasdiqlandi: {purchase['full_name']} — {ticket_list} (💰 {amount} so'm)",
         )
     else:
         purchase = await storage.reject_purchase(purchase_id)
@@ -1394,31 +1470,31 @@ async def admin_decision(update: Update, context: CallbackContext) -> None:
             await _edit_admin_message(query, "ℹ️ Bu chek allaqachon ko'rib chiqilgan.")
             return
 
-        await _edit_admin_message(query, "❌ Chek rad etildi.")
         manager_contact = await storage.get_manager_contact()
-        contact_username = manager_contact.lstrip("@") or "menejer_1w"
-        contact_url = f"https://t.me/{contact_username}"
-        await context.bot.send_message(
-            chat_id=purchase["user_id"],
-            text=(
-                "❌ Kechirasiz, to'lov tasdiqlanmadi.\n"
-                "Iltimos, ma'lumotlarni tekshirib, qayta yuboring."
+        await asyncio.gather(
+            _suppress_telegram_error(
+                _edit_admin_message(query, "❌ Chek rad etildi.", _admin_card_kind(purchase))
             ),
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("admin bilan bog'lanish", url=contact_url)]
-                ]
+            _suppress_telegram_error(
+                context.bot.send_message(
+                    chat_id=purchase["user_id"],
+                    text=(
+                        "❌ Kechirasiz, to'lov tasdiqlanmadi.\n"
+                        "Iltimos, ma'lumotlarni tekshirib, qayta yuboring."
+                    ),
+                    reply_markup=_manager_contact_keyboard(manager_contact),
+                )
             ),
         )
 
 
 async def admin_broadcast_entry(update: Update, context: CallbackContext) -> None:
     """Prompt admin for broadcast content."""
-    if context.user_data.get("broadcast_mode") == "awaiting_content":
+    if context.user_data.get("_active_mode") == "broadcast":
         await update.message.reply_text("ℹ️ Hozirda yuboriladigan xabarni kutyapman. Iltimos, xabarni yuboring yoki bekor qiling.")
         return
 
-    context.user_data["broadcast_mode"] = "awaiting_content"
+    context.user_data["_active_mode"] = "broadcast"
     if update.message:
         context.user_data["broadcast_ignore_message_id"] = update.message.message_id
     await update.message.reply_text(
@@ -1426,15 +1502,13 @@ async def admin_broadcast_entry(update: Update, context: CallbackContext) -> Non
             "✉️ Yuboriladigan xabarni yuboring. Matn, rasm yoki video (caption bilan) qo'llab-quvvatlanadi.\n"
             "Bekor qilish uchun tugmadan foydalaning."
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Bekor qilish", callback_data="cancel_broadcast")]]
-        ),
+        reply_markup=_CANCEL_BROADCAST_KB,
     )
 
 
 async def admin_broadcast_handle_content(update: Update, context: CallbackContext) -> None:
     """Send broadcast message to all known users when mode is active."""
-    if context.user_data.get("broadcast_mode") != "awaiting_content":
+    if context.user_data.get("_active_mode") != "broadcast":
         return
 
     ignore_id = context.user_data.pop("broadcast_ignore_message_id", None)
@@ -1442,64 +1516,65 @@ async def admin_broadcast_handle_content(update: Update, context: CallbackContex
         return
 
     message = update.message
-    if message.photo:
-        payload = {
-            "type": "photo",
-            "file_id": message.photo[-1].file_id,
-            "caption": (message.caption or "").strip(),
-        }
-    elif message.video:
-        payload = {
-            "type": "video",
-            "file_id": message.video.file_id,
-            "caption": (message.caption or "").strip(),
-        }
-    else:
-        text = (message.text or "").strip()
-        if not text:
-            await update.message.reply_text("❗ Xabar bo'sh bo'lishi mumkin emas. Qaytadan yuboring.")
-            return
-        payload = {"type": "text", "text": text}
+    if not (message.photo or message.video or (message.text or "").strip()):
+        await update.message.reply_text("❗ Xabar bo'sh bo'lishi mumkin emas. Qaytadan yuboring.")
+        return
 
-    storage: StorageManager = context.application.bot_data["storage"]
-    user_ids = await storage.list_user_ids()
-    if not user_ids:
-        context.user_data.pop("broadcast_mode", None)
+    storage = _storage(context)
+    total = await storage.count_users()
+    if not total:
+        context.user_data.pop("_active_mode", None)
         await update.message.reply_text(
             "📭 Hozircha xabar yuboriladigan foydalanuvchi mavjud emas.",
             reply_markup=admin_menu_keyboard(),
         )
         return
 
-    await update.message.reply_text(
-        f"✉️ Xabar yuborilmoqda... (jami {len(user_ids)} foydalanuvchi)", reply_markup=admin_menu_keyboard()
+    status_message = await update.message.reply_text(
+        f"✉️ Xabar yuborilmoqda... (jami {total} foydalanuvchi)", reply_markup=admin_menu_keyboard()
     )
 
+    # Telegram copies the admin's message server-side, so text, photo and video
+    # broadcasts share one call and no file ids or captions are re-sent.
+    bot = context.bot
+    source_chat_id, source_message_id = message.chat_id, message.message_id
+
+    async def sender(user_id: int) -> None:
+        await bot.copy_message(chat_id=user_id, from_chat_id=source_chat_id, message_id=source_message_id)
+
+    semaphore = asyncio.Semaphore(_BROADCAST_CONCURRENCY)
+    pacer = asyncio.Lock()
+    progress = {"done": 0}
+
+    async def _send_one(user_id: int) -> bool:
+        async with semaphore:
+            # Serialising the pause keeps the global send rate under Telegram's limit.
+            async with pacer:
+                await asyncio.sleep(1 / _BROADCAST_RATE)
+            try:
+                await sender(user_id)
+                ok = True
+            except TelegramError:
+                ok = False
+
+            progress["done"] += 1
+            done = progress["done"]
+            if done % _BROADCAST_PROGRESS_EVERY == 0 and done < total:
+                try:
+                    await status_message.edit_text(f"✉️ Xabar yuborilmoqda... ({done}/{total})")
+                except TelegramError:
+                    pass
+            return ok
+
     delivered = 0
     failed = 0
-    for user_id in user_ids:
-        try:
-            if payload["type"] == "text":
-                await context.bot.send_message(chat_id=user_id, text=payload["text"])
-            elif payload["type"] == "photo":
-                await context.bot.send_photo(
-                    chat_id=user_id,
-                    photo=payload["file_id"],
-                    caption=payload.get("caption") or None,
-                )
-            elif payload["type"] == "video":
-                await context.bot.send_video(
-                    chat_id=user_id,
-                    video=payload["file_id"],
-                    caption=payload.get("caption") or None,
-                )
-            delivered += 1
-        except TelegramError:
-            failed += 1
-            continue
-        await asyncio.sleep(0.05)
+    async for chunk in storage.iter_user_ids():
+        results = await asyncio.gather(*(_send_one(user_id) for user_id in chunk))
+        sent = sum(1 for ok in results if ok)
+        delivered += sent
+        failed += len(results) - sent
 
-    context.user_data.pop("broadcast_mode", None)
+    context.user_data.pop("_active_mode", None)
     await update.message.reply_text(
         f"✅ Yuborildi: {delivered} ta\n⚠️ Yuborilmadi: {failed} ta",
         reply_markup=admin_menu_keyboard(),
@@ -1510,7 +1585,7 @@ async def admin_broadcast_cancel(update: Update, context: CallbackContext) -> No
     """Cancel the broadcast flow from inline button."""
     query = update.callback_query
     await query.answer()
-    context.user_data.pop("broadcast_mode", None)
+    context.user_data.pop("_active_mode", None)
     context.user_data.pop("broadcast_ignore_message_id", None)
     await query.edit_message_text("✉️ Xabar yuborish bekor qilindi.")
 
@@ -1519,22 +1594,20 @@ async def admin_start_message_entry_cb(update: Update, context: CallbackContext)
     """Start-message edit flow triggered from settings inline button."""
     query = update.callback_query
     await query.answer()
-    context.user_data["start_edit_mode"] = True
+    context.user_data["_active_mode"] = "start_edit"
     await context.bot.send_message(
         chat_id=query.message.chat_id,
         text=(
             "✏️ Start xabarining yangi matnini yoki media (caption bilan) yuboring.\n"
             "Bekor qilish uchun tugmadan foydalaning."
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Bekor qilish", callback_data="cancel_start_message")]]
-        ),
+        reply_markup=_CANCEL_START_KB,
     )
 
 
 async def admin_start_message_handle_input(update: Update, context: CallbackContext) -> None:
     """Persist the new start message template when editing mode is active."""
-    if not context.user_data.get("start_edit_mode"):
+    if context.user_data.get("_active_mode") != "start_edit":
         return
 
     message = update.message
@@ -1552,7 +1625,7 @@ async def admin_start_message_handle_input(update: Update, context: CallbackCont
         await update.message.reply_text("❗ Matn bo'sh bo'lishi mumkin emas. Qayta kiriting.")
         return
 
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     settings = context.application.bot_data["settings"]
 
     try:
@@ -1586,14 +1659,14 @@ async def admin_start_message_handle_input(update: Update, context: CallbackCont
             "✅ Start xabari yangilandi. Joriy ko'rinish:\n\n" + preview["text"],
             reply_markup=admin_menu_keyboard(),
         )
-    context.user_data.pop("start_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
 
 
 async def admin_start_message_cancel(update: Update, context: CallbackContext) -> None:
     """Cancel the start message editing flow via inline button."""
     query = update.callback_query
     await query.answer()
-    context.user_data.pop("start_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
     await query.edit_message_text("✏️ Start xabarini tahrirlash bekor qilindi.")
 
 
@@ -1601,8 +1674,8 @@ async def admin_game_info_message_entry_cb(update: Update, context: CallbackCont
     """Begin game-info message editing from settings."""
     query = update.callback_query
     await query.answer()
-    context.user_data["game_info_edit_mode"] = True
-    storage: StorageManager = context.application.bot_data["storage"]
+    context.user_data["_active_mode"] = "game_info_edit"
+    storage = _storage(context)
     current = await storage.get_game_info_message()
     await context.bot.send_message(
         chat_id=query.message.chat_id,
@@ -1613,18 +1686,13 @@ async def admin_game_info_message_entry_cb(update: Update, context: CallbackCont
             "Joriy xabar:\n"
             f"{current}"
         ),
-        reply_markup=InlineKeyboardMarkup(
-            [
-                [InlineKeyboardButton("♻️ Standart holatga qaytarish", callback_data="reset_game_info_message")],
-                [InlineKeyboardButton("Bekor qilish", callback_data="cancel_game_info_message")],
-            ]
-        ),
+        reply_markup=_GAME_INFO_EDIT_KB,
     )
 
 
 async def admin_game_info_message_handle_input(update: Update, context: CallbackContext) -> None:
     """Persist the updated game-info message template."""
-    if not context.user_data.get("game_info_edit_mode"):
+    if context.user_data.get("_active_mode") != "game_info_edit":
         return
 
     text = (update.message.text or "").strip()
@@ -1632,7 +1700,7 @@ async def admin_game_info_message_handle_input(update: Update, context: Callback
         await update.message.reply_text("❗ Faqat matn yuboring. Bo'sh xabar qabul qilinmaydi.")
         return
 
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     settings = context.application.bot_data["settings"]
 
     try:
@@ -1651,14 +1719,14 @@ async def admin_game_info_message_handle_input(update: Update, context: Callback
         "✅ 'O'yin haqida' xabari yangilandi. Joriy ko'rinish:\n\n" + preview,
         reply_markup=admin_menu_keyboard(),
     )
-    context.user_data.pop("game_info_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
 
 
 async def admin_game_info_message_cancel(update: Update, context: CallbackContext) -> None:
     """Cancel game-info editing flow via inline button."""
     query = update.callback_query
     await query.answer()
-    context.user_data.pop("game_info_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
     await query.edit_message_text("ℹ️ O'yin haqida xabarini tahrirlash bekor qilindi.")
 
 
@@ -1666,7 +1734,7 @@ async def admin_game_info_message_reset(update: Update, context: CallbackContext
     """Restore the game-info message to its default template."""
     query = update.callback_query
     await query.answer()
-    storage: StorageManager = context.application.bot_data["storage"]
+    storage = _storage(context)
     settings = context.application.bot_data["settings"]
     await storage.reset_game_info_message()
     preview = await storage.render_game_info_message(
@@ -1675,7 +1743,7 @@ async def admin_game_info_message_reset(update: Update, context: CallbackContext
         ticket_price=_format_money(settings.ticket_price),
     )
 
-    context.user_data.pop("game_info_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
 
     try:
         await query.edit_message_text("♻️ 'O'yin haqida' xabari standart holatga qaytarildi.")
@@ -1693,32 +1761,44 @@ async def admin_cancel(update: Update, context: CallbackContext) -> None:
     """Fallback handler to exit admin flows via /cancel."""
     context.user_data.pop("subscription_mode", None)
     context.user_data.pop("settings_mode", None)
-    context.user_data.pop("broadcast_mode", None)
-    context.user_data.pop("start_edit_mode", None)
-    context.user_data.pop("game_info_edit_mode", None)
+    context.user_data.pop("_active_mode", None)
+    context.user_data.pop("broadcast_ignore_message_id", None)
     await update.message.reply_text("❌ Jarayon bekor qilindi.", reply_markup=admin_menu_keyboard())
 
 
+# Only one of these flows can be active at a time; see "_active_mode" in user_data.
+_ACTIVE_MODE_ROUTES = {
+    "broadcast": admin_broadcast_handle_content,
+    "start_edit": admin_start_message_handle_input,
+    "game_info_edit": admin_game_info_message_handle_input,
+}
+
+
 async def admin_active_mode_router(update: Update, context: CallbackContext) -> None:
     """Route incoming admin messages to active modes (broadcast/start edit/restore)."""
-    if context.user_data.get("broadcast_mode") == "awaiting_content":
-        await admin_broadcast_handle_content(update, context)
-        return
-    if context.user_data.get("start_edit_mode"):
-        await admin_start_message_handle_input(update, context)
-        return
-    if context.user_data.get("game_info_edit_mode"):
-        await admin_game_info_message_handle_input(update, context)
+    handler = _ACTIVE_MODE_ROUTES.get(context.user_data.get("_active_mode"))
+    if handler:
+        await handler(update, context)
         return
     if context.user_data.get("settings_mode") == "restore_backup":
         await admin_settings_handle_restore(update, context)
         return
 
 
-async def _edit_admin_message(query, text: str) -> None:
-    """Edit the admin's message caption or text."""
-    message = query.message
-    if message.photo or message.document:
+def _admin_card_kind(purchase) -> Optional[str]:
+    return (purchase.get("admin_message") or {}).get("kind")
+
+
+async def _edit_admin_message(query, text: str, kind: Optional[str] = None) -> None:
+    """Edit the admin's message caption or text.
+
+    ``kind`` is the card type recorded when the card was sent; the message is
+    only inspected when it is unknown.
+    """
+    if kind is None:
+        message = query.message
+        kind = "media" if message.photo or message.document else "text"
+    if kind == "media":
         await query.edit_message_caption(caption=text, reply_markup=None)
     else:
         await query.edit_message_text(text=text, reply_markup=None)
@@ -1,11 +1,15 @@
 """Handlers for user-facing interactions."""
 from __future__ import annotations
 
-import re
-from typing import Optional, Tuple
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 
 from telegram import ReplyKeyboardRemove, Update
-from telegram.error import BadRequest, TelegramError
+from telegram.error import NetworkError, RetryAfter, TelegramError
 from telegram.ext import (
     CallbackContext,
     CallbackQueryHandler,
@@ -15,6 +19,7 @@ from telegram.ext import (
     filters,
 )
 
+from lottery_bot.config import Settings
 from lottery_bot.keyboards import (
     admin_decision_keyboard,
     cancel_keyboard,
@@ -26,13 +31,44 @@ from lottery_bot.storage import StorageManager
 
 WAITING_QUANTITY, WAITING_CONTACT, WAITING_RECEIPT = range(3)
 
+# user_data keys that only live for the duration of one purchase conversation.
+_PURCHASE_KEYS = ("quantity", "phone_number", "payable")
+
+# Confirmed channel memberships, user_id -> {channel_id: monotonic expiry}, least recently
+# confirmed user first; at most _MEMBERSHIP_CACHE_MAX users are kept.
+# Only positive results are cached so a user who just subscribed is never held back.
+_MEMBERSHIP_TTL = 120.0
+_MEMBERSHIP_CACHE_MAX = 10_000
+_membership_cache: "OrderedDict[int, Dict[str, float]]" = OrderedDict()
+
+# Users whose profile was refreshed by /start recently, user_id -> (monotonic expiry, storage
+# data_generation). A reset or restore bumps the generation, so those users are registered again.
+# Entries are kept in expiry order, so the oldest is evicted first once the map is full.
+_RECENT_USER_TTL = 3600.0
+_RECENT_USER_MAX = 10_000
+_recent_users: "OrderedDict[int, Tuple[float, int]]" = OrderedDict()
+
+_PAYMENT_TEMPLATE = (
+    "💳 To'lov qilish uchun quyidagi ma'lumotlardan foydalaning:\n"
+    "• Karta raqami: {card}\n"
+    "• To'lov summasi: {amount} so'm\n\n"
+    "To'lovni amalga oshirganingizdan so'ng, chekni botga rasm yoki fayl sifatida yuboring."
+)
+
+# Backoff for transient Telegram failures; flood-control waits use the server's retry_after instead.
+_TG_RETRY_BASE = 0.5
+_TG_RETRY_CAP = 10.0
+_TG_RETRY_JITTER = 0.5
+
 
+@lru_cache(maxsize=512)
 def _format_currency(amount: int) -> str:
     return f"{amount:,}".replace(",", " ")
 
 
 def _normalize_phone(raw: str) -> Optional[str]:
-    digits = re.sub(r"\D", "", raw)
+    # str.isdecimal matches exactly what the regex \d matched, without the regex engine.
+    digits = "".join(filter(str.isdecimal, raw))
     if len(digits) < 9:
         return None
     if raw.strip().startswith("+"):
@@ -44,75 +80,148 @@ def _normalize_phone(raw: str) -> Optional[str]:
     return "+" + digits
 
 
-async def _ensure_subscription(update: Update, context: CallbackContext) -> bool:
-    storage: StorageManager = context.application.bot_data["storage"]
+async def _tg_call(
+    coro_factory: Callable[[], Awaitable[Any]], *, attempts: int = 5, idempotent: bool = False
+) -> Any:
+    """Run an outbound Telegram call, retrying on flood control and, if ``idempotent``, network errors.
+
+    A request that timed out has often been delivered already, so sends are never retried on
+    network errors; repeating them would post duplicates. Flood control rejects the request
+    outright, so RetryAfter is always safe to retry.
+    """
+    for attempt in range(attempts):
+        try:
+            return await coro_factory()
+        except RetryAfter as exc:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(exc.retry_after)
+        except NetworkError:
+            # TimedOut is a NetworkError subclass; BadRequest and Forbidden are not and fail fast.
+            if not idempotent or attempt == attempts - 1:
+                raise
+            delay = min(_TG_RETRY_CAP, _TG_RETRY_BASE * 2**attempt)
+            await asyncio.sleep(delay + random.uniform(0, _TG_RETRY_JITTER))
+
+
+def _clear_purchase_state(context: CallbackContext) -> None:
+    user_data = context.user_data
+    for key in _PURCHASE_KEYS:
+        user_data.pop(key, None)
+
+
+def _remember_membership(user_id: int, chat_id: str, now: float) -> None:
+    channels = _membership_cache.get(user_id)
+    if channels is None:
+        channels = _membership_cache[user_id] = {}
+        if len(_membership_cache) > _MEMBERSHIP_CACHE_MAX:
+            _membership_cache.popitem(last=False)
+    else:
+        _membership_cache.move_to_end(user_id)
+    channels[chat_id] = now + _MEMBERSHIP_TTL
+
+
+def _forget_memberships(user_id: int) -> None:
+    _membership_cache.pop(user_id, None)
+
+
+def _is_recently_registered(user_id: int, generation: int) -> bool:
+    """Report whether /start already refreshed this user's profile within the TTL, marking it if not."""
+    now = time.monotonic()
+    entry = _recent_users.get(user_id)
+    if entry is not None and entry[0] > now and entry[1] == generation:
+        return True
+    _recent_users[user_id] = (now + _RECENT_USER_TTL, generation)
+    _recent_users.move_to_end(user_id)
+    if len(_recent_users) > _RECENT_USER_MAX:
+        _recent_users.popitem(last=False)
+    return False
+
+
+async def _ensure_subscription(update: Update, context: CallbackContext, storage: StorageManager) -> bool:
+    if storage.subscription_gate_required is False:
+        return True
     config = await storage.get_subscription_config()
     if not config["enabled"] or not config["channels"]:
         return True
 
     user = update.effective_user
+    now = time.monotonic()
+    cached = _membership_cache.get(user.id, {})
     missing = []
+    to_check = []
     for channel in config["channels"]:
         chat_id = channel.get("id")
         if not chat_id:
             missing.append(channel)
             continue
-        try:
-            member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user.id)
-        except Exception:
+        cached_until = cached.get(chat_id)
+        if cached_until is not None and cached_until > now:
+            continue
+        to_check.append(channel)
+
+    # Render the prompt for the "nothing joined" case while the memberships are being checked;
+    # it is the usual outcome for a user who has not subscribed yet.
+    render_task = None
+    if to_check:
+        render_task = asyncio.create_task(storage.render_subscription_message(config["channels"]))
+    # Query all remaining channels at once so latency is one round-trip, not one per channel.
+    results = await asyncio.gather(
+        *(
+            # Every gated handler waits on this, so allow one retry only; a failure counts as not joined.
+            _tg_call(
+                lambda chat_id=channel["id"]: context.bot.get_chat_member(chat_id=chat_id, user_id=user.id),
+                attempts=2,
+                idempotent=True,
+            )
+            for channel in to_check
+        ),
+        return_exceptions=True,
+    )
+    for channel, member in zip(to_check, results):
+        if isinstance(member, Exception):
             missing.append(channel)
             continue
-
         status = getattr(member, "status", None)
         is_member = getattr(member, "is_member", None)
         if status in {"creator", "administrator", "member"} or is_member:
+            _remember_membership(user.id, channel["id"], now)
             continue
         missing.append(channel)
 
     if not missing:
+        if render_task is not None:
+            render_task.cancel()
         return True
 
-    message_text = await storage.render_subscription_message(missing)
+    if render_task is not None and missing == config["channels"]:
+        message_text = await render_task
+    else:
+        if render_task is not None:
+            render_task.cancel()
+        message_text = await storage.render_subscription_message(missing)
     keyboard = subscription_prompt_keyboard(missing or config["channels"])
 
+    reply_kwargs = {"reply_markup": keyboard, "disable_web_page_preview": True}
     if update.callback_query:
+        # check_subscription_callback has already answered the query, so the result is reported in
+        # the chat: the edited prompt lists the channels still missing. When the prompt is unchanged
+        # the edit is a no-op, so send it again as a fresh message for the user to see.
         query = update.callback_query
-        titles = ", ".join((channel.get("title") or channel.get("id") or "Kanal") for channel in missing)
-        alert_text = "Avval quyidagi kanallarga obuna bo'ling: " + titles
-        await query.answer(alert_text[:200], show_alert=True)
         try:
-            await query.edit_message_text(message_text, reply_markup=keyboard, disable_web_page_preview=True)
-        except BadRequest as exc:
-            if "message is not modified" in str(exc).lower():
-                return False
-            try:
-                await query.message.reply_text(
-                    message_text,
-                    reply_markup=keyboard,
-                    disable_web_page_preview=True,
-                )
-            except TelegramError:
-                pass
+            await query.edit_message_text(message_text, **reply_kwargs)
         except TelegramError:
             try:
-                await query.message.reply_text(
-                    message_text,
-                    reply_markup=keyboard,
-                    disable_web_page_preview=True,
-                )
+                await query.message.reply_text(message_text, **reply_kwargs)
             except TelegramError:
                 pass
     else:
-        await update.message.reply_text(
-            message_text,
-            reply_markup=keyboard,
-            disable_web_page_preview=True,
-        )
+        await update.message.reply_text(message_text, **reply_kwargs)
     return False
 
 
-async def _send_start_content(update: Update, context: CallbackContext, storage: StorageManager) -> None:
-    settings = context.application.bot_data["settings"]
+async def _dispatch_start_content(bot, chat_id: int, storage: StorageManager, settings: Settings) -> None:
+    """Send the welcome text or media to ``chat_id``; shared by /start and the subscription re-check."""
     remaining = await storage.remaining_tickets()
     content = await storage.render_start_content(
         prize=settings.prize_name,
@@ -123,39 +232,48 @@ async def _send_start_content(update: Update, context: CallbackContext, storage:
 
     media = content.get("media") if isinstance(content, dict) else None
     text = content.get("text") if isinstance(content, dict) else content
-    message = update.message
 
     if media and media.get("type") == "photo":
-        await message.reply_photo(
-            photo=media.get("file_id"),
-            caption=text,
-            reply_markup=main_menu_keyboard(),
+        await _tg_call(
+            lambda: bot.send_photo(
+                chat_id=chat_id,
+                photo=media.get("file_id"),
+                caption=text,
+                reply_markup=main_menu_keyboard(),
+            )
         )
     elif media and media.get("type") == "video":
-        await message.reply_video(
-            video=media.get("file_id"),
-            caption=text,
-            reply_markup=main_menu_keyboard(),
+        await _tg_call(
+            lambda: bot.send_video(
+                chat_id=chat_id,
+                video=media.get("file_id"),
+                caption=text,
+                reply_markup=main_menu_keyboard(),
+            )
         )
     else:
-        await message.reply_text(text, reply_markup=main_menu_keyboard())
+        await _tg_call(lambda: bot.send_message(chat_id=chat_id, text=text, reply_markup=main_menu_keyboard()))
 
 
-async def start(update: Update, context: CallbackContext) -> None:
+async def start(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> None:
     """Show the welcome message and menu."""
-    settings = context.application.bot_data["settings"]
-    storage: StorageManager = context.application.bot_data["storage"]
     user = update.effective_user
-    await storage.register_user(user.id, user.username, user.full_name)
-    if not await _ensure_subscription(update, context):
+    # Profile bookkeeping is not needed for the reply, so it is persisted off the response path.
+    if not _is_recently_registered(user.id, storage.data_generation):
+        context.application.create_task(
+            storage.register_user(user.id, user.username, user.full_name),
+            update=update,
+        )
+    if not await _ensure_subscription(update, context, storage):
         return
-    await _send_start_content(update, context, storage)
+    await _dispatch_start_content(context.bot, update.effective_chat.id, storage, settings)
 
 
-async def buy_ticket_entry(update: Update, context: CallbackContext) -> int:
+async def buy_ticket_entry(update: Update, context: CallbackContext, *, storage: StorageManager) -> int:
     """Ask the user how many tickets they want."""
-    storage: StorageManager = context.application.bot_data["storage"]
-    if not await _ensure_subscription(update, context):
+    if not await _ensure_subscription(update, context, storage):
         return ConversationHandler.END
     remaining = await storage.remaining_tickets()
     if remaining == 0:
@@ -171,11 +289,12 @@ async def buy_ticket_entry(update: Update, context: CallbackContext) -> int:
     return WAITING_QUANTITY
 
 
-async def receive_quantity(update: Update, context: CallbackContext) -> int:
+async def receive_quantity(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> int:
     """Validate desired quantity and show payment instructions."""
     text = (update.message.text or "").strip()
-    storage: StorageManager = context.application.bot_data["storage"]
-    if not await _ensure_subscription(update, context):
+    if not await _ensure_subscription(update, context, storage):
         return ConversationHandler.END
     remaining = await storage.remaining_tickets()
 
@@ -190,7 +309,6 @@ async def receive_quantity(update: Update, context: CallbackContext) -> int:
         )
         return WAITING_QUANTITY
 
-    settings = context.application.bot_data["settings"]
     payable = quantity * settings.ticket_price
     context.user_data["quantity"] = quantity
     context.user_data["payable"] = payable
@@ -202,7 +320,7 @@ async def receive_quantity(update: Update, context: CallbackContext) -> int:
 
     if phone_number:
         context.user_data["phone_number"] = phone_number
-        await _send_payment_instructions(update, context, payable)
+        await _send_payment_instructions(update, storage, payable)
         return WAITING_RECEIPT
 
     await update.message.reply_text(
@@ -212,22 +330,18 @@ async def receive_quantity(update: Update, context: CallbackContext) -> int:
     return WAITING_CONTACT
 
 
-async def _send_payment_instructions(update: Update, context: CallbackContext, payable: int) -> None:
-    storage: StorageManager = context.application.bot_data["storage"]
+async def _send_payment_instructions(update: Update, storage: StorageManager, payable: int) -> None:
     card_number = await storage.get_card_number()
-    instructions = (
-        "💳 To'lov qilish uchun quyidagi ma'lumotlardan foydalaning:\n"
-        f"• Karta raqami: {card_number}\n"
-        f"• To'lov summasi: {_format_currency(payable)} so'm\n\n"
-        "To'lovni amalga oshirganingizdan so'ng, chekni botga rasm yoki fayl sifatida yuboring."
-    )
+    instructions = _PAYMENT_TEMPLATE.format(card=card_number, amount=_format_currency(payable))
     await update.message.reply_text(
         instructions,
         reply_markup=cancel_keyboard(),
     )
 
 
-async def receive_contact(update: Update, context: CallbackContext) -> int:
+async def receive_contact(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> int:
     """Capture and persist the user's contact number."""
     contact = update.message.contact
     if contact and contact.user_id and contact.user_id != update.effective_user.id:
@@ -241,27 +355,32 @@ async def receive_contact(update: Update, context: CallbackContext) -> int:
         return WAITING_CONTACT
 
     context.user_data["phone_number"] = phone_number
-    settings = context.application.bot_data["settings"]
-    storage: StorageManager = context.application.bot_data["storage"]
     user = update.effective_user
-    await storage.register_user(user.id, user.username, user.full_name, phone_number=phone_number)
+    context.application.create_task(
+        storage.register_user(user.id, user.username, user.full_name, phone_number=phone_number),
+        update=update,
+    )
 
     payable = context.user_data.get("payable", settings.ticket_price)
-    await _send_payment_instructions(update, context, payable)
+    await _send_payment_instructions(update, storage, payable)
     return WAITING_RECEIPT
 
 
 def _extract_receipt(update: Update) -> Tuple[str | None, str | None]:
     """Return the file_id and type for a receipt message."""
     message = update.message
-    if message.photo:
-        return message.photo[-1].file_id, "photo"
-    if message.document:
-        return message.document.file_id, "document"
+    photos = message.photo
+    if photos:
+        return photos[-1].file_id, "photo"
+    document = message.document
+    if document:
+        return document.file_id, "document"
     return None, None
 
 
-async def receive_receipt(update: Update, context: CallbackContext) -> int:
+async def receive_receipt(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> int:
     """Persist pending purchase and notify admin."""
     receipt_file_id, receipt_type = _extract_receipt(update)
     if not receipt_file_id:
@@ -270,15 +389,18 @@ async def receive_receipt(update: Update, context: CallbackContext) -> int:
 
     quantity = context.user_data.pop("quantity", 1)
     user = update.effective_user
-    settings = context.application.bot_data["settings"]
-    storage: StorageManager = context.application.bot_data["storage"]
 
+    # A phone number in user_data was either read from the stored profile or just saved by
+    # receive_contact, so the profile only needs writing when none exists yet.
     phone_number = context.user_data.get("phone_number")
     if not phone_number:
         profile = await storage.get_user_profile(user.id)
         phone_number = profile.get("phone_number") if profile else None
-
-    await storage.register_user(user.id, user.username, user.full_name, phone_number=phone_number)
+        if profile is None:
+            context.application.create_task(
+                storage.register_user(user.id, user.username, user.full_name, phone_number=phone_number),
+                update=update,
+            )
 
     purchase_id = await storage.create_pending_purchase(
         user_id=user.id,
@@ -304,74 +426,71 @@ async def receive_receipt(update: Update, context: CallbackContext) -> int:
     )
 
     if receipt_type == "photo":
-        admin_message = await context.bot.send_photo(
-            chat_id=settings.admin_id,
-            photo=receipt_file_id,
-            caption=caption,
-            reply_markup=admin_decision_keyboard(purchase_id),
-        )
+        send_receipt = partial(context.bot.send_photo, photo=receipt_file_id)
     else:
-        admin_message = await context.bot.send_document(
-            chat_id=settings.admin_id,
-            document=receipt_file_id,
-            caption=caption,
-            reply_markup=admin_decision_keyboard(purchase_id),
+        send_receipt = partial(context.bot.send_document, document=receipt_file_id)
+
+    async def _notify_admin() -> None:
+        admin_message = await _tg_call(
+            lambda: send_receipt(
+                chat_id=settings.admin_id,
+                caption=caption,
+                reply_markup=admin_decision_keyboard(purchase_id),
+            )
+        )
+        await storage.set_admin_message(
+            purchase_id=purchase_id,
+            chat_id=admin_message.chat_id,
+            message_id=admin_message.message_id,
+            kind="media",
         )
 
-    await storage.set_admin_message(
-        purchase_id=purchase_id,
-        chat_id=admin_message.chat_id,
-        message_id=admin_message.message_id,
-    )
-
-    await update.message.reply_text(
-        "✅ Rahmat! Chekingiz adminga yuborildi. Tasdiqlangach, chipta raqamingiz yuboriladi.",
-        reply_markup=main_menu_keyboard(),
-    )
-
-    await context.bot.send_message(
-        chat_id=settings.admin_id,
-        text=f"📥 Yangi to'lov: {user.full_name} — {quantity} ta chipta.",
+    # The caption already announces the new payment, so the admin gets one message per receipt.
+    # Only recording the admin card depends on the admin send; the user confirmation goes to
+    # a different chat and runs alongside the whole chain.
+    await asyncio.gather(
+        _notify_admin(),
+        _tg_call(
+            lambda: update.message.reply_text(
+                "✅ Rahmat! Chekingiz adminga yuborildi. Tasdiqlangach, chipta raqamingiz yuboriladi.",
+                reply_markup=main_menu_keyboard(),
+            )
+        ),
     )
 
-    context.user_data.pop("phone_number", None)
-    context.user_data.pop("payable", None)
+    _clear_purchase_state(context)
 
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: CallbackContext) -> int:
     """Allow user to exit the flow."""
-    context.user_data.pop("quantity", None)
-    context.user_data.pop("phone_number", None)
-    context.user_data.pop("payable", None)
+    _clear_purchase_state(context)
     await update.message.reply_text("⛔ Jarayon bekor qilindi.", reply_markup=main_menu_keyboard())
     return ConversationHandler.END
 
 
-async def my_tickets(update: Update, context: CallbackContext) -> None:
+async def my_tickets(update: Update, context: CallbackContext, *, storage: StorageManager) -> None:
     """Show all tickets owned by the user."""
-    storage: StorageManager = context.application.bot_data["storage"]
-    if not await _ensure_subscription(update, context):
+    if not await _ensure_subscription(update, context, storage):
         return
-    tickets = await storage.get_user_tickets(update.effective_user.id)
-    if not tickets:
+    formatted = await storage.get_user_tickets_text(update.effective_user.id)
+    if not formatted:
         await update.message.reply_text("📭 Sizda hali tasdiqlangan chiptalar yo'q.")
         return
 
-    formatted = ", ".join(str(ticket) for ticket in tickets)
     await update.message.reply_text(
         "🎟 Sizga biriktirilgan chiptalar:\n" + formatted,
         reply_markup=main_menu_keyboard(),
     )
 
 
-async def game_info(update: Update, context: CallbackContext) -> None:
+async def game_info(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> None:
     """Provide basic information about the lottery."""
-    if not await _ensure_subscription(update, context):
+    if not await _ensure_subscription(update, context, storage):
         return
-    settings = context.application.bot_data["settings"]
-    storage: StorageManager = context.application.bot_data["storage"]
     message = await storage.render_game_info_message(
         prize=settings.prize_name,
         total_tickets=settings.total_tickets,
@@ -380,33 +499,38 @@ async def game_info(update: Update, context: CallbackContext) -> None:
     await update.message.reply_text(message, reply_markup=main_menu_keyboard())
 
 
-def build_conversation_handler() -> ConversationHandler:
+def build_conversation_handler(storage: StorageManager, settings: Settings) -> ConversationHandler:
     """Configure the buy-ticket conversation handler."""
+    buy_entry = partial(buy_ticket_entry, storage=storage)
+    contact_handler = partial(receive_contact, storage=storage, settings=settings)
     return ConversationHandler(
         entry_points=[
-            MessageHandler(filters.Regex("^🎟 Chiptani sotib olish$"), buy_ticket_entry),
-            CommandHandler("buy", buy_ticket_entry),
+            MessageHandler(filters.Text(["🎟 Chiptani sotib olish"]), buy_entry),
+            CommandHandler("buy", buy_entry),
         ],
         states={
             WAITING_QUANTITY: [
-                MessageHandler(filters.Regex("^❌ Bekor qilish$"), cancel),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_quantity),
+                MessageHandler(filters.Text(["❌ Bekor qilish"]), cancel),
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    partial(receive_quantity, storage=storage, settings=settings),
+                ),
             ],
             WAITING_CONTACT: [
-                MessageHandler(filters.Regex("^❌ Bekor qilish$"), cancel),
-                MessageHandler(filters.CONTACT, receive_contact),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_contact),
+                MessageHandler(filters.Text(["❌ Bekor qilish"]), cancel),
+                MessageHandler(filters.CONTACT, contact_handler),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, contact_handler),
             ],
             WAITING_RECEIPT: [
-                MessageHandler(filters.Regex("^❌ Bekor qilish$"), cancel),
+                MessageHandler(filters.Text(["❌ Bekor qilish"]), cancel),
                 MessageHandler(
                     (filters.PHOTO | filters.Document.ALL) & ~filters.COMMAND,
-                    receive_receipt,
+                    partial(receive_receipt, storage=storage, settings=settings),
                 ),
             ],
         },
         fallbacks=[
-            MessageHandler(filters.Regex("^❌ Bekor qilish$"), cancel),
+            MessageHandler(filters.Text(["❌ Bekor qilish"]), cancel),
             CommandHandler("cancel", cancel),
         ],
         allow_reentry=True,
@@ -415,46 +539,40 @@ def build_conversation_handler() -> ConversationHandler:
 
 def register_user_handlers(application) -> None:
     """Attach user handlers to the application."""
-    application.add_handler(CommandHandler("start", start))
+    # Both are startup singletons, so handlers get them bound here instead of reading bot_data per update.
+    storage: StorageManager = application.bot_data["storage"]
+    settings: Settings = application.bot_data["settings"]
+    application.add_handler(CommandHandler("start", partial(start, storage=storage, settings=settings)))
     application.add_handler(CommandHandler("cancel", cancel))
-    application.add_handler(build_conversation_handler())
-    application.add_handler(MessageHandler(filters.Regex("^📋 Mening chiptalarim$"), my_tickets))
-    application.add_handler(MessageHandler(filters.Regex("^ℹ️ O'yin haqida$"), game_info))
-    application.add_handler(CallbackQueryHandler(check_subscription_callback, pattern="^check_subscription$"))
+    application.add_handler(build_conversation_handler(storage, settings))
+    application.add_handler(
+        MessageHandler(filters.Text(["📋 Mening chiptalarim"]), partial(my_tickets, storage=storage))
+    )
+    application.add_handler(
+        MessageHandler(
+            filters.Text(["ℹ️ O'yin haqida"]),
+            partial(game_info, storage=storage, settings=settings),
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            partial(check_subscription_callback, storage=storage, settings=settings),
+            pattern="^check_subscription$",
+        )
+    )
 
 
-async def check_subscription_callback(update: Update, context: CallbackContext) -> None:
+async def check_subscription_callback(
+    update: Update, context: CallbackContext, *, storage: StorageManager, settings: Settings
+) -> None:
     """Re-run the subscription check when user clicks the inline button."""
-    if await _ensure_subscription(update, context):
-        query = update.callback_query
+    query = update.callback_query
+    # Acknowledge first so the button spinner stops while the memberships are re-checked.
+    await query.answer()
+    _forget_memberships(update.effective_user.id)
+    if await _ensure_subscription(update, context, storage):
         await query.edit_message_text(
             "✅ Rahmat! Siz barcha kanallarga obuna bo'lgansiz. Endi botdan foydalanishingiz mumkin.",
         )
-        storage: StorageManager = context.application.bot_data["storage"]
-        settings = context.application.bot_data["settings"]
-        remaining = await storage.remaining_tickets()
-        content = await storage.render_start_content(
-            prize=settings.prize_name,
-            total_tickets=settings.total_tickets,
-            remaining_tickets=remaining,
-            ticket_price=_format_currency(settings.ticket_price),
-        )
-        media = content.get("media") if isinstance(content, dict) else None
-        text = content.get("text") if isinstance(content, dict) else content
         chat_id = query.message.chat_id if query.message else query.from_user.id
-        if media and media.get("type") == "photo":
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=media.get("file_id"),
-                caption=text,
-                reply_markup=main_menu_keyboard(),
-            )
-        elif media and media.get("type") == "video":
-            await context.bot.send_video(
-                chat_id=chat_id,
-                video=media.get("file_id"),
-                caption=text,
-                reply_markup=main_menu_keyboard(),
-            )
-        else:
-            await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=main_menu_keyboard())
+        await _dispatch_start_content(context.bot, chat_id, storage, settings)
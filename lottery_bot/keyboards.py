@@ -1,34 +1,55 @@
 """Reusable Telegram keyboards."""
 from __future__ import annotations
 
-from typing import Iterable, List
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
+# Static keyboards are immutable Telegram objects, so one instance is shared by every reply.
+_MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        ["🎟 Chiptani sotib olish", "📋 Mening chiptalarim"],
+        ["ℹ️ O'yin haqida"],
+    ],
+    resize_keyboard=True,
+)
+
+_ADMIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        ["🏠 Bosh sahifa", "📊 Statistika"],
+        ["⏳ Kutilayotgan to'lovlar", "✅ Tasdiqlangan to'lovlar"],
+        ["✉️ Xabar yuborish", "👥 Foydalanuvchilar"],
+        ["📡 Kanal boshqaruvi", "📥 Excel eksport"],
+        ["⚙️ Bot sozlamlari"],
+    ],
+    resize_keyboard=True,
+)
+
+_CANCEL_KB = ReplyKeyboardMarkup(
+    keyboard=[["❌ Bekor qilish"]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+_CONTACT_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton("📞 Telefon raqamni yuborish", request_contact=True)],
+        ["❌ Bekor qilish"],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
 
 def main_menu_keyboard() -> ReplyKeyboardMarkup:
     """Reply keyboard for regular users."""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            ["🎟 Chiptani sotib olish", "📋 Mening chiptalarim"],
-            ["ℹ️ O'yin haqida"],
-        ],
-        resize_keyboard=True,
-    )
+    return _MAIN_MENU
 
 
 def admin_menu_keyboard() -> ReplyKeyboardMarkup:
     """Reply keyboard for admin actions."""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            ["🏠 Bosh sahifa", "📊 Statistika"],
-            ["⏳ Kutilayotgan to'lovlar", "✅ Tasdiqlangan to'lovlar"],
-            ["✉️ Xabar yuborish", "👥 Foydalanuvchilar"],
-            ["📡 Kanal boshqaruvi", "📥 Excel eksport"],
-            ["⚙️ Bot sozlamlari"],
-        ],
-        resize_keyboard=True,
-    )
+    return _ADMIN_MENU
 
 
 def admin_decision_keyboard(purchase_id: str) -> InlineKeyboardMarkup:
@@ -45,32 +66,27 @@ def admin_decision_keyboard(purchase_id: str) -> InlineKeyboardMarkup:
 
 def cancel_keyboard() -> ReplyKeyboardMarkup:
     """Reply keyboard with cancel button for purchase flow."""
-    return ReplyKeyboardMarkup(
-        keyboard=[["❌ Bekor qilish"]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    return _CANCEL_KB
 
 
 def request_contact_keyboard() -> ReplyKeyboardMarkup:
     """Reply keyboard requesting the user's phone number."""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton("📞 Telefon raqamni yuborish", request_contact=True)],
-            ["❌ Bekor qilish"],
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    return _CONTACT_KB
 
 
 def subscription_prompt_keyboard(channels: Iterable[dict]) -> InlineKeyboardMarkup:
     """Inline keyboard showing subscription links and a re-check button."""
+    key = tuple((channel.get("id"), channel.get("title"), channel.get("link")) for channel in channels)
+    return _subscription_prompt_keyboard(key)
+
+
+@lru_cache(maxsize=64)
+def _subscription_prompt_keyboard(
+    channels: Tuple[Tuple[Optional[str], Optional[str], Optional[str]], ...]
+) -> InlineKeyboardMarkup:
     buttons: List[List[InlineKeyboardButton]] = []
-    for channel in channels:
-        link = channel.get("link")
-        title = channel.get("title") or channel.get("id") or "Kanal"
+    for channel_id, title, link in channels:
         if link:
-            buttons.append([InlineKeyboardButton(title, url=link)])
+            buttons.append([InlineKeyboardButton(title or channel_id or "Kanal", url=link)])
     buttons.append([InlineKeyboardButton("✅ Tekshirish", callback_data="check_subscription")])
     return InlineKeyboardMarkup(buttons)
@@ -2,16 +2,38 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
+import itertools
 import json
+import mmap
+import os
 import random
-from datetime import datetime, timedelta, timezone
+import string
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
 from uuid import uuid4
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up, stdlib json is the fallback
+    orjson = None
+
 
 PurchaseData = Dict[str, Any]
 
+# Mutations landing within this window are written to disk together.
+_PERSIST_DELAY = 0.05
+# Once the journal grows past this size the next write folds it into a fresh snapshot.
+_JOURNAL_COMPACT_BYTES = 1 << 20
+# Purchase history entries kept on each user record; older ones move to history/<user_id>.log.
+_HISTORY_LIMIT = 50
+
 DEFAULT_START_TEMPLATE = (
     "Lotareya botiga xush kelibsiz!\n\n"
     "🎁 Sovrin: {prize}\n"
@@ -42,20 +64,252 @@ def _now() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def _epoch() -> int:
+    """Current time in whole epoch seconds, the format of user activity timestamps."""
+    return int(time.time())
+
+
+def _to_epoch(value: Any) -> int:
+    """Convert a legacy ISO timestamp to epoch seconds; unreadable values become 0."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def _dumps(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _dumps_line(entry: Any) -> bytes:
+    """Encode one compact journal line."""
+    if orjson is not None:
+        return orjson.dumps(entry, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _read_json(path: Path) -> Any:
+    """Parse a JSON file, mapping it into memory when orjson can read the mapping directly."""
+    if orjson is None:
+        return json.loads(path.read_bytes())
+    with path.open("rb") as handle:
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped; let the parser report them.
+            return orjson.loads(handle.read())
+        try:
+            with memoryview(mapped) as view:
+                return orjson.loads(view)
+        finally:
+            mapped.close()
+
+
+# Sections keyed by user id. JSON object keys are strings, so they are turned into ints on
+# load; both encoders write int keys back out as strings.
+_USER_KEYED_SECTIONS = ("users", "user_tickets")
+
+
+def _user_key(key: Any) -> Any:
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return key
+
+
+def _key_by_user_id(payload: Dict[str, Any]) -> None:
+    for section in _USER_KEYED_SECTIONS:
+        if isinstance(payload.get(section), dict):
+            payload[section] = {_user_key(key): value for key, value in payload[section].items()}
+
+
+@lru_cache(maxsize=16)
+def _compile_template(text: str) -> Optional[Tuple[Tuple[str, Optional[str]], ...]]:
+    """Split a ``str.format`` template into (literal, field name) pairs once per distinct text.
+
+    Returns None for templates using format specs, conversions or attribute/index lookups;
+    those keep going through ``str.format``.
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            return None
+        parts.append((literal, field))
+    return tuple(parts)
+
+
+def _render_template(text: str, **values: Any) -> str:
+    """Same result as ``text.format(**values)``, without reparsing the template on every call."""
+    parts = _compile_template(text)
+    if parts is None:
+        return text.format(**values)
+    chunks = []
+    for literal, field in parts:
+        chunks.append(literal)
+        if field is not None:
+            chunks.append(format(values[field]))
+    return "".join(chunks)
+
+
 class StorageManager:
     """Manage ticket availability, purchases, analytics, and configuration."""
 
-    def __init__(self, path: Path, total_tickets: int, *, default_card_number: str | None = None) -> None:
+    def __init__(
+        self,
+        path: Path,
+        total_tickets: int,
+        *,
+        default_card_number: str | None = None,
+        durable: bool = False,
+    ) -> None:
         self._path = path
         self._total_tickets = total_tickets
         self._default_card_number = default_card_number
+        # Sync each write to disk before reporting it done; off by default, as an OS crash is rare.
+        self._durable = durable
+        # No method awaits while holding the lock, so every critical section runs to completion
+        # without yielding; splitting it per section would not let more handlers run at once.
+        # Keep it that way: do slow work (file I/O, parsing) before acquiring or after releasing.
+        # For the same reason, readers that never await can skip the lock: no mutation is ever
+        # half-applied while another coroutine runs.
         self._lock = asyncio.Lock()
+        self._approved_version = 0
+        self._data_generation = 0
+        self._manager_contact_cache: Optional[str] = None
+        self._card_number_cache: Optional[str] = None
+        self._subscription_config_cache: Optional[Dict[str, Any]] = None
+        self._subscription_render_cache: Dict[Any, str] = {}
+        self._user_tickets_text_cache: Dict[int, str] = {}
+        # Last rendered welcome content as (render inputs, content); None when invalidated.
+        self._start_content_cache: Optional[Tuple[Tuple[str, int, int, str], Dict[str, Any]]] = None
+        # The writer starts on the first mutation, once an event loop is running.
+        self._dirty: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self._inflight: Optional[asyncio.Future] = None
+        # Changes are appended to <store>.log as journal lines and folded into the snapshot on compaction.
+        self._journal_path = path.with_suffix(".log")
+        self._journal_lines: List[bytes] = []
+        self._journal_size = 0
+        self._needs_snapshot = False
+        # History entries trimmed from user records, appended to their per-user log by the next write.
+        self._history_dir = path.parent / "history"
+        self._history_spool: Dict[int, List[bytes]] = {}
+        self._clear_history = False
         self._data = self._load()
         self._ensure_defaults(self._data)
+        # Both sections always exist after _ensure_defaults; rebound whenever _data is replaced.
+        self._meta: Dict[str, Any] = self._data["meta"]
+        self._subs: Dict[str, Any] = self._data["subscriptions"]
+        # Working copy of available_tickets in no particular order, with each ticket's index so
+        # draws can swap-remove; the sorted list in _data is refreshed only when writing.
+        self._available: List[int] = []
+        self._available_pos: Dict[int, int] = {}
+        self._set_available(self._data["available_tickets"])
+        self._stats: Dict[str, int] = {}
+        self._activity_order: "OrderedDict[int, None]" = OrderedDict()
+        self._rebuild_user_indexes()
+        self._approved_revenue = 0
+        self._pending_amount = 0
+        self._rebuild_purchase_totals()
+
+    @property
+    def approved_version(self) -> int:
+        """Counter bumped whenever the set of approved purchases changes."""
+        return self._approved_version
+
+    @property
+    def data_generation(self) -> int:
+        """Counter bumped whenever reset or restore replaces the whole dataset."""
+        return self._data_generation
+
+    @property
+    def subscription_gate_required(self) -> Optional[bool]:
+        """Whether channel gating is active, or None until the config has been loaded."""
+        config = self._subscription_config_cache
+        if config is None:
+            return None
+        return config["enabled"] and bool(config["channels"])
+
+    def _rebuild_user_indexes(self) -> None:
+        """Recompute the running user aggregates and the activity order from the user records."""
+        users = self._data["users"]
+        self._stats = {
+            "total_tickets_sold": sum(int(record.get("total_tickets", 0)) for record in users.values()),
+            "total_revenue": sum(int(record.get("total_spent", 0)) for record in users.values()),
+            "total_purchases": sum(int(record.get("purchases", 0)) for record in users.values()),
+        }
+        ordered = sorted(users, key=lambda key: users[key].get("last_active") or 0)
+        self._activity_order = OrderedDict.fromkeys(ordered)
+
+    def _set_available(self, tickets: Iterable[int]) -> None:
+        self._available = list(dict.fromkeys(tickets))
+        self._available_pos = {ticket: index for index, ticket in enumerate(self._available)}
+
+    def _draw_tickets(self, quantity: int) -> List[int]:
+        """Remove and return ``quantity`` uniformly drawn available tickets, O(1) per ticket."""
+        pool = self._available
+        positions = self._available_pos
+        drawn = []
+        for _ in range(quantity):
+            index = random.randrange(len(pool))
+            ticket = pool[index]
+            last = pool.pop()
+            if last != ticket:
+                pool[index] = last
+                positions[last] = index
+            del positions[ticket]
+            drawn.append(ticket)
+        return drawn
+
+    def _return_tickets(self, tickets: Iterable[int]) -> None:
+        pool = self._available
+        positions = self._available_pos
+        for ticket in tickets:
+            if ticket not in positions:
+                positions[ticket] = len(pool)
+                pool.append(ticket)
+
+    def _rebuild_purchase_totals(self) -> None:
+        """Recompute the running approved revenue and pending amount; mutators keep them current."""
+        self._approved_revenue = sum(item.get("amount", 0) for item in self._data["approved"].values())
+        self._pending_amount = sum(item.get("amount", 0) for item in self._data["pending"].values())
+
+    def _touch_user(self, key: int) -> None:
+        """Move a user to the most recently active end; call whenever last_active is updated."""
+        self._activity_order[key] = None
+        self._activity_order.move_to_end(key)
+
+    def _append_history(self, key: int, record: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        history = record.setdefault("history", [])
+        history.append(entry)
+        self._spool_history(key, history)
+
+    def _spool_history(self, key: int, history: List[Dict[str, Any]]) -> None:
+        """Move entries beyond _HISTORY_LIMIT from ``history`` to the user's spool, oldest first."""
+        overflow = len(history) - _HISTORY_LIMIT
+        if overflow > 0:
+            self._history_spool.setdefault(key, []).extend(_dumps_line(item) for item in history[:overflow])
+            del history[:overflow]
+
+    def _invalidate_subscription_cache(self) -> None:
+        self._subscription_config_cache = None
+        self._subscription_render_cache.clear()
 
     def _default_payload(self) -> Dict[str, Any]:
         tickets = list(range(1, self._total_tickets + 1))
         return {
+            "journal_id": 0,
             "available_tickets": tickets,
             "pending": {},
             "approved": {},
@@ -75,12 +329,21 @@ class StorageManager:
         }
 
     def _ensure_defaults(self, payload: Dict[str, Any]) -> None:
+        payload.setdefault("journal_id", 0)
         payload.setdefault("available_tickets", list(range(1, self._total_tickets + 1)))
         payload.setdefault("pending", {})
         payload.setdefault("approved", {})
         payload.setdefault("rejected", {})
         payload.setdefault("user_tickets", {})
         payload.setdefault("users", {})
+        # Older snapshots stored user activity as ISO strings and kept the full purchase history.
+        for key, record in payload["users"].items():
+            for field in ("first_seen", "last_active"):
+                if field in record and not isinstance(record[field], int):
+                    record[field] = _to_epoch(record[field])
+            if len(record.get("history") or ()) > _HISTORY_LIMIT:
+                self._spool_history(key, record["history"])
+                self._needs_snapshot = True
 
         meta = payload.setdefault("meta", {})
         if "start_message" not in meta:
@@ -99,24 +362,214 @@ class StorageManager:
         subs.setdefault("enabled", False)
         subs.setdefault("channels", [])
 
+        # Approved ticket lists are kept sorted (see approve_purchase); fix up older snapshots and backups.
+        for purchase in payload["approved"].values():
+            if purchase.get("tickets"):
+                purchase["tickets"] = sorted(purchase["tickets"])
+
     def _load(self) -> Dict[str, Any]:
         if not self._path.exists():
             payload = self._default_payload()
-            self._persist(payload)
+            # Without a store, leftover history logs belong to an earlier dataset; drop them with it.
+            self._write_bytes([_dumps(payload)], True, 0, clear_history=True)
             return payload
 
-        with self._path.open("r", encoding="utf-8") as handle:
-            payload = json.load(handle)
+        payload = _read_json(self._path)
+        _key_by_user_id(payload)
+        self._replay_journal(payload)
 
-        # Defensive tidy-up to guard against manual edits.
-        available = payload.get("available_tickets", [])
-        payload["available_tickets"] = sorted({int(t) for t in available})
+        # Defensive tidy-up to guard against manual edits. The list only seeds the _available pool
+        # (which drops duplicates) and is re-sorted on every snapshot, so just make sure it holds ints.
+        available = payload.setdefault("available_tickets", [])
+        if not all(type(ticket) is int for ticket in available):
+            payload["available_tickets"] = [int(ticket) for ticket in available]
         return payload
 
-    def _persist(self, payload: Dict[str, Any]) -> None:
-        self._path.parent.mkdir(parents=True, exist_ok=True)
-        with self._path.open("w", encoding="utf-8") as handle:
-            json.dump(payload, handle, ensure_ascii=False, indent=2)
+    def _replay_journal(self, payload: Dict[str, Any]) -> None:
+        """Apply journal lines written after the snapshot; a torn last line ends the replay."""
+        if not self._journal_path.exists():
+            return
+        lines = self._journal_path.read_bytes().splitlines()
+        if not lines:
+            return
+        # Whatever the journal holds, the first write folds it away so new lines get a current header.
+        self._needs_snapshot = True
+        try:
+            header = _loads(lines[0])
+        except ValueError:
+            return
+        if not isinstance(header, dict) or header.get("journal_id") != payload.get("journal_id", 0):
+            # Left over from before the last compaction; the snapshot already contains it.
+            return
+
+        available = set(payload.get("available_tickets", []))
+        for line in lines[1:]:
+            try:
+                op, *args = _loads(line)
+            except ValueError:
+                break
+            if op == "take":
+                available.difference_update(args[0])
+            elif op == "put":
+                available.update(args[0])
+            else:
+                path = args[0]
+                if len(path) > 1 and path[0] in _USER_KEYED_SECTIONS:
+                    # Older journals recorded user ids as string keys.
+                    path[1] = _user_key(path[1])
+                node = payload
+                for key in path[:-1]:
+                    node = node.setdefault(key, {})
+                if op == "set":
+                    node[path[-1]] = args[1]
+                else:
+                    node.pop(path[-1], None)
+        payload["available_tickets"] = list(available)
+
+    def _write_bytes(
+        self,
+        chunks: List[bytes],
+        snapshot: bool,
+        journal_id: int,
+        history: Optional[Dict[int, List[bytes]]] = None,
+        clear_history: bool = False,
+    ) -> None:
+        """Blocking file write; runs in a worker thread.
+
+        ``chunks`` are handed to the file as they are, so journal lines are never joined into a copy.
+        """
+        with self._write_lock:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            if clear_history and self._history_dir.exists():
+                for log in self._history_dir.glob("*.log"):
+                    log.unlink()
+            # Spooled entries land before the store that no longer holds them.
+            if history:
+                self._history_dir.mkdir(exist_ok=True)
+                for key, lines in history.items():
+                    with (self._history_dir / f"{key}.log").open("ab") as handle:
+                        handle.writelines(lines)
+                        self._sync(handle)
+            if snapshot:
+                # Write a sibling file and swap it in, so a crash never leaves a truncated store.
+                tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+                with tmp_path.open("wb") as handle:
+                    handle.writelines(chunks)
+                    self._sync(handle)
+                os.replace(tmp_path, self._path)
+                # The snapshot carries a new journal_id, so even an untruncated journal is ignored on load.
+                with self._journal_path.open("wb"):
+                    pass
+                return
+            with self._journal_path.open("ab") as handle:
+                if handle.seek(0, os.SEEK_END) == 0:
+                    handle.write(_dumps_line({"journal_id": journal_id}))
+                handle.writelines(chunks)
+                self._sync(handle)
+
+    def _sync(self, handle: Any) -> None:
+        if self._durable:
+            handle.flush()
+            getattr(os, "fdatasync", os.fsync)(handle.fileno())
+
+    async def _settle_writes(self) -> None:
+        """Wait until no write is running; a caller that then continues without awaiting sees none start."""
+        while self._inflight is not None and not self._inflight.done():
+            await asyncio.wait({self._inflight})
+
+    async def _write_pending(self, compact: bool = False) -> None:
+        # Writes must land in the order they were encoded: an append racing a compacting snapshot
+        # could be truncated away or filed under a stale journal header. flush() and the writer
+        # task can both get here, so wait for the running write before encoding the next one.
+        await self._settle_writes()
+        # Encode under the lock for a consistent view, but leave the disk write to a thread
+        # so handlers are not blocked on it.
+        async with self._lock:
+            self._dirty.clear()
+            snapshot = compact or self._needs_snapshot or self._journal_size >= _JOURNAL_COMPACT_BYTES
+            if snapshot:
+                self._data["journal_id"] += 1
+                self._data["available_tickets"] = sorted(self._available)
+                chunks = [_dumps(self._data)]
+                self._journal_size = 0
+                self._needs_snapshot = False
+            else:
+                chunks = self._journal_lines
+                self._journal_size += sum(map(len, chunks))
+            self._journal_lines = []
+            journal_id = self._data["journal_id"]
+            history, self._history_spool = self._history_spool, {}
+            clear_history, self._clear_history = self._clear_history, False
+        # Shielded so that cancelling the writer never abandons a half-finished append.
+        write = asyncio.to_thread(self._write_bytes, chunks, snapshot, journal_id, history, clear_history)
+        self._inflight = asyncio.ensure_future(write)
+        try:
+            await asyncio.shield(self._inflight)
+        except OSError:
+            # Lines may have been lost, so retry with a full snapshot on the next mutation or flush().
+            for key, lines in history.items():
+                self._history_spool[key] = lines + self._history_spool.get(key, [])
+            self._clear_history = self._clear_history or clear_history
+            self._needs_snapshot = True
+            self._dirty.set()
+            raise
+
+    def _mark_dirty(self, *paths: Tuple[str, ...]) -> None:
+        """Schedule a coalesced write; call with the lock held.
+
+        ``paths`` name the records that changed, e.g. ``("users", 42)``; each is journaled as its
+        current value, or as a deletion when it no longer exists. Without paths the next write is
+        a full snapshot.
+        """
+        if paths:
+            for path in paths:
+                node = self._data
+                for key in path[:-1]:
+                    node = node.get(key, {})
+                if path[-1] in node:
+                    self._journal_lines.append(_dumps_line(["set", path, node[path[-1]]]))
+                else:
+                    self._journal_lines.append(_dumps_line(["del", path]))
+        else:
+            self._needs_snapshot = True
+        if self._dirty is None:
+            self._dirty = asyncio.Event()
+        self._dirty.set()
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writeback_loop())
+
+    def _journal_tickets(self, op: str, tickets: List[int]) -> None:
+        """Journal tickets leaving ("take") or returning to ("put") the available pool."""
+        self._journal_lines.append(_dumps_line([op, tickets]))
+
+    async def _writeback_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(_PERSIST_DELAY)
+            await self._write_pending()
+
+    async def flush(self) -> None:
+        """Fold all pending changes into the snapshot file; the writer restarts on the next mutation.
+
+        Call on shutdown, and before reading the store file directly.
+        """
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except (asyncio.CancelledError, OSError):
+                pass
+            self._writer_task = None
+        if self._inflight is not None:
+            try:
+                await self._inflight
+            except OSError:
+                pass
+        dirty = self._dirty is not None and self._dirty.is_set()
+        if dirty or self._journal_size or self._needs_snapshot:
+            if self._dirty is None:
+                self._dirty = asyncio.Event()
+            await self._write_pending(compact=True)
 
     async def register_user(
         self,
@@ -128,22 +581,22 @@ class StorageManager:
         """Create or update a user record for analytics."""
 
         async with self._lock:
-            now_iso = _now().isoformat()
-            record = self._data["users"].get(str(user_id))
+            now = _epoch()
+            record = self._data["users"].get(user_id)
             if not record:
                 record = {
                     "user_id": user_id,
                     "username": username,
                     "full_name": full_name,
                     "phone_number": phone_number,
-                    "first_seen": now_iso,
-                    "last_active": now_iso,
+                    "first_seen": now,
+                    "last_active": now,
                     "purchases": 0,
                     "total_tickets": 0,
                     "total_spent": 0,
                     "history": [],
                 }
-                self._data["users"][str(user_id)] = record
+                self._data["users"][user_id] = record
             else:
                 if username is not None:
                     record["username"] = username
@@ -151,16 +604,15 @@ class StorageManager:
                     record["full_name"] = full_name
                 if phone_number:
                     record["phone_number"] = phone_number
-                record["last_active"] = now_iso
-            self._persist(self._data)
+                record["last_active"] = now
+            self._touch_user(user_id)
+            self._mark_dirty(("users", user_id))
 
     async def remaining_tickets(self) -> int:
-        async with self._lock:
-            return len(self._data["available_tickets"])
+        return len(self._available)
 
     async def list_available_tickets(self) -> List[int]:
-        async with self._lock:
-            return list(self._data["available_tickets"])
+        return sorted(self._available)
 
     async def create_pending_purchase(
         self,
@@ -191,10 +643,14 @@ class StorageManager:
                 "status": "pending",
             }
             self._data["pending"][purchase_id] = payload
-            self._persist(self._data)
+            self._pending_amount += payload["amount"]
+            self._mark_dirty(("pending", purchase_id))
             return purchase_id
 
-    async def set_admin_message(self, purchase_id: str, chat_id: int, message_id: int) -> None:
+    async def set_admin_message(
+        self, purchase_id: str, chat_id: int, message_id: int, kind: Optional[str] = None
+    ) -> None:
+        """Remember the admin review card; ``kind`` is "media" or "text" when known."""
         async with self._lock:
             purchase = self._data["pending"].get(purchase_id)
             if not purchase:
@@ -202,104 +658,140 @@ class StorageManager:
             purchase["admin_message"] = {
                 "chat_id": chat_id,
                 "message_id": message_id,
+                "kind": kind,
             }
-            self._persist(self._data)
+            self._mark_dirty(("pending", purchase_id))
 
     async def is_pending(self, purchase_id: str) -> bool:
-        async with self._lock:
-            return purchase_id in self._data["pending"]
+        return purchase_id in self._data["pending"]
 
     async def approve_purchase(self, purchase_id: str) -> Tuple[List[int], PurchaseData]:
         async with self._lock:
-            purchase = self._data["pending"].pop(purchase_id, None)
-            if not purchase:
-                return [], {}
-
-            quantity = purchase["quantity"]
-            available = self._data["available_tickets"]
-            if len(available) < quantity:
-                # Put it back and signal the caller to handle shortage.
-                self._data["pending"][purchase_id] = purchase
-                return [], {}
-
-            tickets = random.sample(available, quantity)
-            for ticket in tickets:
-                available.remove(ticket)
-
-            user_bucket = self._data["user_tickets"].setdefault(str(purchase["user_id"]), [])
-            user_bucket.extend(tickets)
+            return self._approve_locked(purchase_id)
 
-            now_iso = _now().isoformat()
-            purchase.update(
-                {
-                    "status": "approved",
-                    "tickets": tickets,
-                    "resolved_at": now_iso,
-                }
-            )
-            self._data["approved"][purchase_id] = purchase
-
-            # Update user analytics bucket.
-            user_record = self._data["users"].setdefault(
-                str(purchase["user_id"]),
-                {
-                    "user_id": purchase["user_id"],
-                    "username": purchase.get("username"),
-                    "full_name": purchase.get("full_name"),
-                    "phone_number": purchase.get("phone_number"),
-                    "first_seen": now_iso,
-                    "last_active": now_iso,
-                    "purchases": 0,
-                    "total_tickets": 0,
-                    "total_spent": 0,
-                    "history": [],
-                },
-            )
-            user_record["purchases"] = user_record.get("purchases", 0) + 1
-            user_record["total_tickets"] = user_record.get("total_tickets", 0) + quantity
-            user_record["total_spent"] = user_record.get("total_spent", 0) + purchase.get("amount", 0)
-            user_record["last_active"] = now_iso
-            if purchase.get("phone_number"):
-                user_record["phone_number"] = purchase["phone_number"]
-            history = user_record.setdefault("history", [])
-            history.append(
-                {
-                    "purchase_id": purchase_id,
-                    "tickets": tickets,
-                    "amount": purchase.get("amount", 0),
-                    "quantity": quantity,
-                    "resolved_at": now_iso,
-                }
-            )
+    async def approve_many(self, purchase_ids: List[str]) -> List[Tuple[List[int], PurchaseData]]:
+        """Approve several purchases under one lock acquisition; results follow ``purchase_ids``."""
+        async with self._lock:
+            return [self._approve_locked(purchase_id) for purchase_id in purchase_ids]
+
+    def _approve_locked(self, purchase_id: str) -> Tuple[List[int], PurchaseData]:
+        """Body of approve_purchase; call with the lock held."""
+        purchase = self._data["pending"].pop(purchase_id, None)
+        if not purchase:
+            return [], {}
+
+        quantity = purchase["quantity"]
+        if len(self._available) < quantity:
+            # Put it back and signal the caller to handle shortage.
+            self._data["pending"][purchase_id] = purchase
+            return [], {}
+        self._pending_amount -= purchase.get("amount", 0)
+        self._approved_revenue += purchase.get("amount", 0)
+
+        # Invariant: purchase["tickets"] is sorted, so readers never re-sort it.
+        tickets = sorted(self._draw_tickets(quantity))
+
+        user_bucket = self._data["user_tickets"].setdefault(purchase["user_id"], [])
+        user_bucket.extend(tickets)
+        self._user_tickets_text_cache.pop(purchase["user_id"], None)
+
+        now_iso = _now().isoformat()
+        purchase.update(
+            {
+                "status": "approved",
+                "tickets": tickets,
+                "resolved_at": now_iso,
+            }
+        )
+        self._data["approved"][purchase_id] = purchase
+        self._approved_version += 1
+
+        # Update user analytics bucket.
+        now = _epoch()
+        user_record = self._data["users"].setdefault(
+            purchase["user_id"],
+            {
+                "user_id": purchase["user_id"],
+                "username": purchase.get("username"),
+                "full_name": purchase.get("full_name"),
+                "phone_number": purchase.get("phone_number"),
+                "first_seen": now,
+                "last_active": now,
+                "purchases": 0,
+                "total_tickets": 0,
+                "total_spent": 0,
+                "history": [],
+            },
+        )
+        user_record["purchases"] = user_record.get("purchases", 0) + 1
+        user_record["total_tickets"] = user_record.get("total_tickets", 0) + quantity
+        user_record["total_spent"] = user_record.get("total_spent", 0) + purchase.get("amount", 0)
+        user_record["last_active"] = now
+        self._touch_user(purchase["user_id"])
+        self._stats["total_tickets_sold"] += quantity
+        self._stats["total_revenue"] += purchase.get("amount", 0)
+        self._stats["total_purchases"] += 1
+        if purchase.get("phone_number"):
+            user_record["phone_number"] = purchase["phone_number"]
+        user_key = purchase["user_id"]
+        self._append_history(
+            user_key,
+            user_record,
+            {
+                "purchase_id": purchase_id,
+                "tickets": tickets,
+                "amount": purchase.get("amount", 0),
+                "quantity": quantity,
+                "resolved_at": now_iso,
+            },
+        )
 
-            self._persist(self._data)
-            return tickets, purchase
+        self._journal_tickets("take", tickets)
+        self._mark_dirty(
+            ("pending", purchase_id),
+            ("approved", purchase_id),
+            ("user_tickets", user_key),
+            ("users", user_key),
+        )
+        return tickets, purchase
 
     async def reject_purchase(self, purchase_id: str) -> PurchaseData:
         async with self._lock:
-            purchase = self._data["pending"].pop(purchase_id, None)
-            if not purchase:
-                return {}
+            return self._reject_locked(purchase_id)
 
-            purchase.update(
-                {
-                    "status": "rejected",
-                    "resolved_at": _now().isoformat(),
-                }
-            )
-            self._data["rejected"][purchase_id] = purchase
+    async def reject_many(self, purchase_ids: List[str]) -> List[PurchaseData]:
+        """Reject several purchases under one lock acquisition; results follow ``purchase_ids``."""
+        async with self._lock:
+            return [self._reject_locked(purchase_id) for purchase_id in purchase_ids]
+
+    def _reject_locked(self, purchase_id: str) -> PurchaseData:
+        """Body of reject_purchase; call with the lock held."""
+        purchase = self._data["pending"].pop(purchase_id, None)
+        if not purchase:
+            return {}
+        self._pending_amount -= purchase.get("amount", 0)
+
+        purchase.update(
+            {
+                "status": "rejected",
+                "resolved_at": _now().isoformat(),
+            }
+        )
+        self._data["rejected"][purchase_id] = purchase
 
-            # Mark user as active even if rejected.
-            record = self._data["users"].get(str(purchase["user_id"]))
-            if record:
-                record["last_active"] = _now().isoformat()
+        # Mark user as active even if rejected.
+        record = self._data["users"].get(purchase["user_id"])
+        if record:
+            record["last_active"] = _epoch()
+            self._touch_user(purchase["user_id"])
 
-            self._persist(self._data)
-            return purchase
+        user_key = purchase["user_id"]
+        self._mark_dirty(("pending", purchase_id), ("rejected", purchase_id), ("users", user_key))
+        return purchase
 
-    async def list_approved(self) -> List[PurchaseData]:
-        async with self._lock:
-            return [dict(item) for item in self._data["approved"].values()]
+    async def list_approved(self) -> List[Mapping[str, Any]]:
+        """Return read-only views of the approved purchases; they track later changes to the record."""
+        return [MappingProxyType(item) for item in self._data["approved"].values()]
 
     async def cancel_approved_purchase(self, purchase_id: str) -> PurchaseData:
         """Revoke an approved purchase, freeing tickets and updating analytics."""
@@ -307,29 +799,40 @@ class StorageManager:
             purchase = self._data["approved"].pop(purchase_id, None)
             if not purchase:
                 return {}
+            self._approved_version += 1
+            self._approved_revenue -= purchase.get("amount", 0)
 
             tickets = purchase.get("tickets", []) or []
 
             # Return tickets to availability.
-            available = self._data.setdefault("available_tickets", [])
-            available.extend(tickets)
-            available[:] = sorted(set(available))
+            self._return_tickets(tickets)
 
             # Remove tickets from user's bucket.
-            user_bucket = self._data.setdefault("user_tickets", {}).get(str(purchase.get("user_id")), [])
+            user_bucket = self._data.setdefault("user_tickets", {}).get(purchase.get("user_id"), [])
             if user_bucket:
-                remaining = [t for t in user_bucket if t not in tickets]
-                self._data["user_tickets"][str(purchase.get("user_id"))] = remaining
+                cancelled = frozenset(tickets)
+                remaining = [t for t in user_bucket if t not in cancelled]
+                self._data["user_tickets"][purchase.get("user_id")] = remaining
+                self._user_tickets_text_cache.pop(purchase.get("user_id"), None)
 
             # Adjust user stats.
-            user_record = self._data.get("users", {}).get(str(purchase.get("user_id")))
+            user_record = self._data.get("users", {}).get(purchase.get("user_id"))
             if user_record:
+                purchases_before = user_record.get("purchases", 0)
+                tickets_before = user_record.get("total_tickets", 0)
+                spent_before = user_record.get("total_spent", 0)
                 user_record["purchases"] = max(0, user_record.get("purchases", 0) - 1)
                 user_record["total_tickets"] = max(0, user_record.get("total_tickets", 0) - len(tickets))
                 user_record["total_spent"] = max(0, user_record.get("total_spent", 0) - purchase.get("amount", 0))
-                user_record["last_active"] = _now().isoformat()
-                history = user_record.setdefault("history", [])
-                history.append(
+                user_record["last_active"] = _epoch()
+                self._touch_user(purchase.get("user_id"))
+                # Subtract what the record actually lost so the aggregates track the clamped values.
+                self._stats["total_purchases"] -= purchases_before - user_record["purchases"]
+                self._stats["total_tickets_sold"] -= tickets_before - user_record["total_tickets"]
+                self._stats["total_revenue"] -= spent_before - user_record["total_spent"]
+                self._append_history(
+                    purchase.get("user_id"),
+                    user_record,
                     {
                         "purchase_id": purchase_id,
                         "tickets": list(tickets),
@@ -337,68 +840,68 @@ class StorageManager:
                         "quantity": purchase.get("quantity", 0),
                         "resolved_at": _now().isoformat(),
                         "status": "cancelled",
-                    }
+                    },
                 )
 
             purchase.update({"status": "cancelled", "cancelled_at": _now().isoformat()})
-            self._persist(self._data)
+            user_key = purchase.get("user_id")
+            self._journal_tickets("put", tickets)
+            self._mark_dirty(("approved", purchase_id), ("user_tickets", user_key), ("users", user_key))
             return purchase
 
     async def get_user_tickets(self, user_id: int) -> List[int]:
-        async with self._lock:
-            return sorted(self._data["user_tickets"].get(str(user_id), []))
+        return sorted(self._data["user_tickets"].get(user_id, []))
+
+    async def get_user_tickets_text(self, user_id: int) -> str:
+        """Return the user's tickets as a sorted, comma separated string ("" when none)."""
+        cached = self._user_tickets_text_cache.get(user_id)
+        if cached is not None:
+            return cached
+        text = ", ".join(map(str, sorted(self._data["user_tickets"].get(user_id, []))))
+        self._user_tickets_text_cache[user_id] = text
+        return text
 
     async def get_summary(self) -> Dict[str, Any]:
-        async with self._lock:
-            remaining = len(self._data["available_tickets"])
-            sold = self._total_tickets - remaining
-            revenue = sum(item.get("amount", 0) for item in self._data["approved"].values())
-            return {
-                "total": self._total_tickets,
-                "sold": sold,
-                "remaining": remaining,
-                "pending_count": len(self._data["pending"]),
-                "revenue": revenue,
-            }
+        remaining = len(self._available)
+        sold = self._total_tickets - remaining
+        return {
+            "total": self._total_tickets,
+            "sold": sold,
+            "remaining": remaining,
+            "pending_count": len(self._data["pending"]),
+            "revenue": self._approved_revenue,
+        }
 
     async def get_detailed_stats(self) -> Dict[str, Any]:
         async with self._lock:
-            now = _now()
-            users = list(self._data["users"].values())
+            users = self._data["users"]
             total_users = len(users)
+            total_tickets_sold = self._stats["total_tickets_sold"]
+            total_revenue = self._stats["total_revenue"]
+            total_purchases = self._stats["total_purchases"]
+
+            cutoff = _epoch() - 24 * 60 * 60
+
+            # Walk from the most recently active user and stop at the first one outside the window.
             active_24h = 0
+            for key in reversed(self._activity_order):
+                if users[key].get("last_active", 0) < cutoff:
+                    break
+                active_24h += 1
+
+            # Users are inserted on first contact, so the dict is already ordered by first_seen.
             new_24h = 0
-            total_tickets_sold = 0
-            total_revenue = 0
-            total_purchases = 0
-
-            twenty_four_hours_ago = now - timedelta(hours=24)
-
-            for record in users:
-                last_active_raw = record.get("last_active")
-                if last_active_raw:
-                    try:
-                        if datetime.fromisoformat(last_active_raw) >= twenty_four_hours_ago:
-                            active_24h += 1
-                    except ValueError:
-                        pass
-
-                first_seen_raw = record.get("first_seen")
-                if first_seen_raw:
-                    try:
-                        if datetime.fromisoformat(first_seen_raw) >= twenty_four_hours_ago:
-                            new_24h += 1
-                    except ValueError:
-                        pass
-                total_tickets_sold += int(record.get("total_tickets", 0))
-                total_revenue += int(record.get("total_spent", 0))
-                total_purchases += int(record.get("purchases", 0))
-
-            pending_amount = sum(item.get("amount", 0) for item in self._data["pending"].values())
+            for record in reversed(users.values()):
+                if record.get("first_seen", 0) < cutoff:
+                    break
+                new_24h += 1
+
+            pending_amount = self._pending_amount
             approved_count = len(self._data["approved"])
             rejected_count = len(self._data["rejected"])
 
-            top_users = sorted(
+            top_users = heapq.nlargest(
+                5,
                 (
                     {
                         "user_id": record.get("user_id"),
@@ -407,14 +910,13 @@ class StorageManager:
                         "tickets": int(record.get("total_tickets", 0)),
                         "spent": int(record.get("total_spent", 0)),
                     }
-                    for record in users
+                    for record in users.values()
                     if int(record.get("total_tickets", 0)) > 0
                 ),
                 key=lambda item: (item["tickets"], item["spent"]),
-                reverse=True,
-            )[:5]
+            )
 
-            remaining = len(self._data["available_tickets"])
+            remaining = len(self._available)
 
             avg_tickets_per_user = total_tickets_sold / total_users if total_users else 0.0
             avg_spend_per_user = total_revenue / total_users if total_users else 0.0
@@ -437,9 +939,9 @@ class StorageManager:
                 "top_users": top_users,
             }
 
-    async def list_pending(self) -> List[PurchaseData]:
-        async with self._lock:
-            return [dict(item) for item in self._data["pending"].values()]
+    async def list_pending(self) -> List[Mapping[str, Any]]:
+        """Return read-only views of the pending purchases; they track later changes to the record."""
+        return [MappingProxyType(item) for item in self._data["pending"].values()]
 
     async def list_all_users(self) -> List[Dict[str, Any]]:
         """Return all users sorted by total tickets (descending)."""
@@ -447,25 +949,112 @@ class StorageManager:
             users = [dict(record) for record in self._data["users"].values()]
             return sorted(users, key=lambda x: (x.get("total_tickets", 0), x.get("total_spent", 0)), reverse=True)
 
-    async def list_user_ids(self) -> List[int]:
-        async with self._lock:
-            result: List[int] = []
-            for user_id in self._data["users"].keys():
-                try:
-                    result.append(int(user_id))
-                except (TypeError, ValueError):
-                    continue
-            return result
+    async def count_users(self) -> int:
+        return len(self._data["users"])
+
+    async def iter_user_ids(self, batch: int = 1000) -> AsyncIterator[List[int]]:
+        """Yield known user ids in chunks of at most ``batch``, walking the live users section.
+
+        Only one chunk is held at a time. Users are only ever appended between resets and restores,
+        so users registered meanwhile are picked up at the end. A reset or restore ends the walk,
+        because the remaining ids would belong to a different dataset.
+        """
+        generation = self._data_generation
+        users = self._data["users"]
+        keys = iter(users)
+        consumed = 0
+        while True:
+            if self._data_generation != generation or self._data["users"] is not users:
+                return
+            chunk: List[int] = []
+            try:
+                # No await while a chunk is gathered, so the dict only changes between chunks.
+                for user_id in keys:
+                    consumed += 1
+                    # Keys that were not numeric in the stored file stay strings; they are not chat ids.
+                    if isinstance(user_id, int):
+                        chunk.append(user_id)
+                        if len(chunk) == batch:
+                            break
+            except RuntimeError:
+                # New users arrived while the caller held the last chunk; resume after the ones seen.
+                keys = itertools.islice(iter(users), consumed, None)
+                continue
+            if chunk:
+                yield chunk
+            if len(chunk) < batch:
+                return
 
     async def get_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
-        async with self._lock:
-            record = self._data["users"].get(str(user_id))
-            return dict(record) if record else None
+        record = self._data["users"].get(user_id)
+        return dict(record) if record else None
+
+    async def get_user_full_history(self, user_id: int) -> List[Dict[str, Any]]:
+        """Return the user's whole purchase history, oldest first, including entries moved to disk."""
+        # Let a running write land first; nothing below awaits until the in-memory parts are captured.
+        await self._settle_writes()
+        log_path = self._history_dir / f"{user_id}.log"
+        # Logs awaiting a clear belong to data that was reset or replaced.
+        logged_size = log_path.stat().st_size if log_path.exists() and not self._clear_history else 0
+        spooled = list(self._history_spool.get(user_id, []))
+        record = self._data["users"].get(user_id) or {}
+        recent = list(record.get("history") or [])
+
+        def read_logged() -> bytes:
+            if not logged_size:
+                return b""
+            with log_path.open("rb") as handle:
+                return handle.read(logged_size)
+
+        logged = await asyncio.to_thread(read_logged)
+        return [_loads(line) for line in logged.splitlines() + spooled if line.strip()] + recent
+
+    async def write_backup(self, destination: Path) -> None:
+        """Write a self-contained copy of the store to ``destination``, with full user histories.
+
+        The history logs are folded back into the user records, so a backup restores on its own.
+        """
+        await self._settle_writes()
+        # Nothing below awaits until the store, the spool and the log sizes are captured together.
+        self._data["available_tickets"] = sorted(self._available)
+        buffer = _dumps(self._data)
+        spooled = {str(key): list(lines) for key, lines in self._history_spool.items()}
+        logged: Dict[str, Tuple[Path, int]] = {}
+        if not self._clear_history and self._history_dir.exists():
+            for log_path in self._history_dir.glob("*.log"):
+                logged[log_path.stem] = (log_path, log_path.stat().st_size)
+
+        def build() -> None:
+            payload = _loads(buffer)
+            for key, record in payload.get("users", {}).items():
+                older: List[bytes] = []
+                if key in logged:
+                    log_path, size = logged[key]
+                    with log_path.open("rb") as handle:
+                        older.extend(handle.read(size).splitlines())
+                older.extend(spooled.get(key, []))
+                if older:
+                    record["history"] = [_loads(line) for line in older if line.strip()] + (
+                        record.get("history") or []
+                    )
+            destination.write_bytes(_dumps(payload))
+
+        await asyncio.to_thread(build)
 
     @staticmethod
     def _validate_template(text: str, required_keys: List[str]) -> None:
         if not text.strip():
             raise ValueError("Matn bo'sh bo'lishi mumkin emas.")
+        try:
+            parts = _compile_template(text)
+        except ValueError as exc:
+            raise ValueError("Shablonni formatlashda xatolik yuz berdi.") from exc
+        if parts is not None:
+            # Plain {name} fields only: checking the names is enough, and warms the render cache.
+            for _, field in parts:
+                if field is not None and field not in required_keys:
+                    raise ValueError(f"Noma'lum o'zgaruvchi: {field}")
+            return
         payload = {key: f"__{key}__" for key in required_keys}
         try:
             text.format(**payload)
@@ -477,9 +1066,10 @@ class StorageManager:
     async def set_start_message(self, *, text: str, media: Optional[Dict[str, str]]) -> None:
         self._validate_template(text, ["prize", "total_tickets", "remaining_tickets", "ticket_price"])
         async with self._lock:
-            meta = self._data.setdefault("meta", {})
+            meta = self._meta
             meta["start_message"] = {"text": text, "media": media}
-            self._persist(self._data)
+            self._start_content_cache = None
+            self._mark_dirty(("meta", "start_message"))
 
     async def render_start_content(
         self,
@@ -489,24 +1079,35 @@ class StorageManager:
         remaining_tickets: int,
         ticket_price: str,
     ) -> Dict[str, Any]:
-        async with self._lock:
-            start_cfg = self._data.setdefault("meta", {}).get(
-                "start_message", {"text": DEFAULT_START_TEMPLATE, "media": None}
-            )
-        text = start_cfg.get("text", DEFAULT_START_TEMPLATE).format(
+        """Render the welcome content; the result is shared between callers, treat it as read-only."""
+        cache_key = (prize, total_tickets, remaining_tickets, ticket_price)
+        cached = self._start_content_cache
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        start_cfg = self._meta.get(
+            "start_message", {"text": DEFAULT_START_TEMPLATE, "media": None}
+        )
+        text = _render_template(
+            start_cfg.get("text", DEFAULT_START_TEMPLATE),
             prize=prize,
             total_tickets=total_tickets,
             remaining_tickets=remaining_tickets,
             ticket_price=ticket_price,
         )
         media = start_cfg.get("media")
-        return {"text": text, "media": media}
+        content = {"text": text, "media": media}
+        # Renders between two sales share the same inputs; once a ticket sells the old content is
+        # never asked for again, so a single slot is all that pays off.
+        self._start_content_cache = (cache_key, content)
+        return content
 
     async def set_subscription_message(self, text: str) -> None:
         self._validate_template(text, ["channels"])
         async with self._lock:
-            self._data.setdefault("meta", {})["subscription_message"] = text
-            self._persist(self._data)
+            self._meta["subscription_message"] = text
+            self._invalidate_subscription_cache()
+            self._mark_dirty(("meta", "subscription_message"))
 
     async def set_game_info_message(self, text: str) -> None:
         self._validate_template(
@@ -514,42 +1115,50 @@ class StorageManager:
             ["prize", "total_tickets", "sold_tickets", "remaining_tickets", "ticket_price"],
         )
         async with self._lock:
-            self._data.setdefault("meta", {})["game_info_message"] = text
-            self._persist(self._data)
+            self._meta["game_info_message"] = text
+            self._mark_dirty(("meta", "game_info_message"))
 
     async def reset_game_info_message(self) -> str:
         async with self._lock:
-            self._data.setdefault("meta", {})["game_info_message"] = DEFAULT_GAME_INFO_MESSAGE
-            self._persist(self._data)
+            self._meta["game_info_message"] = DEFAULT_GAME_INFO_MESSAGE
+            self._mark_dirty(("meta", "game_info_message"))
             return DEFAULT_GAME_INFO_MESSAGE
 
     async def set_card_number(self, card_number: str) -> None:
         async with self._lock:
-            meta = self._data.setdefault("meta", {})
+            meta = self._meta
             meta["card_number"] = card_number.strip()
-            self._persist(self._data)
+            self._card_number_cache = None
+            self._mark_dirty(("meta", "card_number"))
 
     async def get_card_number(self) -> str:
-        async with self._lock:
-            return self._data.setdefault("meta", {}).get("card_number") or ""
+        cached = self._card_number_cache
+        if cached is not None:
+            return cached
+        card_number = self._meta.get("card_number") or ""
+        self._card_number_cache = card_number
+        return card_number
 
     async def set_manager_contact(self, username: str) -> None:
         async with self._lock:
-            meta = self._data.setdefault("meta", {})
+            meta = self._meta
             meta["manager_contact"] = username.strip()
-            self._persist(self._data)
+            self._manager_contact_cache = None
+            self._mark_dirty(("meta", "manager_contact"))
 
     async def get_manager_contact(self) -> str:
-        async with self._lock:
-            return self._data.setdefault("meta", {}).get("manager_contact") or "@menejer_1w"
+        cached = self._manager_contact_cache
+        if cached is not None:
+            return cached
+        contact = self._meta.get("manager_contact") or "@menejer_1w"
+        self._manager_contact_cache = contact
+        return contact
 
     async def get_subscription_message(self) -> str:
-        async with self._lock:
-            return self._data.setdefault("meta", {}).get("subscription_message", DEFAULT_SUBSCRIPTION_MESSAGE)
+        return self._meta.get("subscription_message", DEFAULT_SUBSCRIPTION_MESSAGE)
 
     async def get_game_info_message(self) -> str:
-        async with self._lock:
-            return self._data.setdefault("meta", {}).get("game_info_message", DEFAULT_GAME_INFO_MESSAGE)
+        return self._meta.get("game_info_message", DEFAULT_GAME_INFO_MESSAGE)
 
     async def render_game_info_message(
         self,
@@ -558,11 +1167,11 @@ class StorageManager:
         total_tickets: int,
         ticket_price: str,
     ) -> str:
-        async with self._lock:
-            template = self._data.setdefault("meta", {}).get("game_info_message", DEFAULT_GAME_INFO_MESSAGE)
-            remaining = len(self._data["available_tickets"])
+        template = self._meta.get("game_info_message", DEFAULT_GAME_INFO_MESSAGE)
+        remaining = len(self._available)
         sold = max(0, total_tickets - remaining)
-        return template.format(
+        return _render_template(
+            template,
             prize=prize,
             total_tickets=total_tickets,
             sold_tickets=sold,
@@ -571,22 +1180,28 @@ class StorageManager:
         )
 
     async def get_subscription_config(self) -> Dict[str, Any]:
-        async with self._lock:
-            subs = self._data.setdefault("subscriptions", {})
-            return {
-                "enabled": bool(subs.get("enabled", False)),
-                "channels": [dict(item) for item in subs.get("channels", [])],
-            }
+        """Return the subscription settings; the snapshot is shared, treat it as read-only."""
+        cached = self._subscription_config_cache
+        if cached is not None:
+            return cached
+        subs = self._subs
+        config = {
+            "enabled": bool(subs.get("enabled", False)),
+            "channels": [dict(item) for item in subs.get("channels", [])],
+        }
+        self._subscription_config_cache = config
+        return config
 
     async def set_subscription_enabled(self, enabled: bool) -> None:
         async with self._lock:
-            subs = self._data.setdefault("subscriptions", {})
+            subs = self._subs
             subs["enabled"] = bool(enabled)
-            self._persist(self._data)
+            self._invalidate_subscription_cache()
+            self._mark_dirty(("subscriptions",))
 
     async def add_subscription_channel(self, channel_id: str, title: str, link: Optional[str]) -> None:
         async with self._lock:
-            subs = self._data.setdefault("subscriptions", {})
+            subs = self._subs
             channels = subs.setdefault("channels", [])
             for item in channels:
                 if item.get("id") == channel_id:
@@ -594,69 +1209,115 @@ class StorageManager:
                     break
             else:
                 channels.append({"id": channel_id, "title": title, "link": link})
-            self._persist(self._data)
+            self._invalidate_subscription_cache()
+            self._mark_dirty(("subscriptions",))
 
     async def remove_subscription_channel(self, channel_id: str) -> bool:
         async with self._lock:
-            subs = self._data.setdefault("subscriptions", {})
+            subs = self._subs
             channels = subs.setdefault("channels", [])
             original_len = len(channels)
             subs["channels"] = [item for item in channels if item.get("id") != channel_id]
             changed = len(subs["channels"]) != original_len
             if changed:
-                self._persist(self._data)
+                self._invalidate_subscription_cache()
+                self._mark_dirty(("subscriptions",))
             return changed
 
-    async def get_ticket_export_rows(self) -> List[Dict[str, Any]]:
-        async with self._lock:
-            rows: List[Dict[str, Any]] = []
-            for purchase in self._data["approved"].values():
-                rows.append(
-                    {
-                        "purchase_id": purchase.get("purchase_id"),
-                        "full_name": purchase.get("full_name"),
-                        "username": purchase.get("username"),
-                        "phone_number": purchase.get("phone_number"),
-                        "quantity": purchase.get("quantity", 0),
-                        "tickets": list(purchase.get("tickets", [])),
-                        "amount": purchase.get("amount", 0),
-                        "resolved_at": purchase.get("resolved_at"),
-                    }
-                )
-            return rows
+    async def get_ticket_export_columns(self) -> Dict[str, List[Any]]:
+        """Return approved purchases as parallel columns for the Excel export.
+
+        Ticket lists are shared with the store (approved ticket lists are never edited in place);
+        treat them as read-only.
+        """
+        approved = list(self._data["approved"].values())
+        return {
+            "purchase_id": [purchase.get("purchase_id") for purchase in approved],
+            "full_name": [purchase.get("full_name") for purchase in approved],
+            "username": [purchase.get("username") for purchase in approved],
+            "phone_number": [purchase.get("phone_number") for purchase in approved],
+            "quantity": [purchase.get("quantity", 0) for purchase in approved],
+            "tickets": [purchase.get("tickets", []) for purchase in approved],
+            "amount": [purchase.get("amount", 0) for purchase in approved],
+            "resolved_at": [purchase.get("resolved_at") for purchase in approved],
+        }
 
     async def render_subscription_message(self, channels_override: Optional[List[Dict[str, Any]]] = None) -> str:
-        async with self._lock:
-            message_template = self._data.setdefault("meta", {}).get(
-                "subscription_message", DEFAULT_SUBSCRIPTION_MESSAGE
-            )
-            if channels_override is not None:
-                channels = channels_override
-            else:
-                channels = self._data.setdefault("subscriptions", {}).setdefault("channels", [])
+        if channels_override is None:
+            cache_key: Any = None
+        else:
+            cache_key = tuple((channel.get("id"), channel.get("title")) for channel in channels_override)
+        cached = self._subscription_render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        message_template = self._meta.get(
+            "subscription_message", DEFAULT_SUBSCRIPTION_MESSAGE
+        )
+        if channels_override is not None:
+            channels = channels_override
+        else:
+            channels = self._subs.setdefault("channels", [])
         if channels:
             lines = [f"• {channel.get('title') or channel.get('id')}" for channel in channels]
             channels_block = "\n".join(lines)
         else:
             channels_block = "• Kanallar qo'shilmagan"
-        return message_template.format(channels=channels_block)
+        rendered = _render_template(message_template, channels=channels_block)
+        self._subscription_render_cache[cache_key] = rendered
+        return rendered
 
     async def reset_all_data(self) -> None:
         """Reset all data to initial state."""
         async with self._lock:
-            self._data = self._default_payload()
-            self._persist(self._data)
+            payload = self._default_payload()
+            # Keep the journal numbering going so the current journal is never mistaken for the new state's.
+            payload["journal_id"] = self._data["journal_id"]
+            self._data = payload
+            self._meta = payload["meta"]
+            self._subs = payload["subscriptions"]
+            self._set_available(self._data["available_tickets"])
+            self._rebuild_user_indexes()
+            self._rebuild_purchase_totals()
+            self._approved_version += 1
+            self._data_generation += 1
+            self._manager_contact_cache = None
+            self._card_number_cache = None
+            self._invalidate_subscription_cache()
+            self._user_tickets_text_cache.clear()
+            self._start_content_cache = None
+            self._history_spool.clear()
+            self._clear_history = True
+            self._mark_dirty()
 
     async def restore_from_backup(self, backup_path: str) -> None:
         """Restore data from a backup file."""
-        import json
+        # Parsing touches no shared state, so it happens in a thread before the lock is taken.
+        backup_data = await asyncio.to_thread(_read_json, Path(backup_path))
+        _key_by_user_id(backup_data)
+
+        # Ensure defaults exist. Backups carry full histories (see write_backup); whatever this
+        # trims must replace, not join, the spool of the data being restored over.
+        current_spool, self._history_spool = self._history_spool, {}
+        self._ensure_defaults(backup_data)
+        restored_spool, self._history_spool = self._history_spool, current_spool
+
         async with self._lock:
-            with open(backup_path, "r", encoding="utf-8") as f:
-                backup_data = json.load(f)
-            
-            # Ensure defaults exist
-            self._ensure_defaults(backup_data)
-            
             # Save to current storage
+            backup_data["journal_id"] = self._data["journal_id"]
             self._data = backup_data
-            self._persist(self._data)
+            self._meta = backup_data["meta"]
+            self._subs = backup_data["subscriptions"]
+            self._set_available(int(ticket) for ticket in backup_data["available_tickets"])
+            self._rebuild_user_indexes()
+            self._rebuild_purchase_totals()
+            self._approved_version += 1
+            self._data_generation += 1
+            self._manager_contact_cache = None
+            self._card_number_cache = None
+            self._invalidate_subscription_cache()
+            self._user_tickets_text_cache.clear()
+            self._start_content_cache = None
+            self._history_spool = restored_spool
+            self._clear_history = True
+            self._mark_dirty()
@@ -10,13 +10,17 @@ from lottery_bot.handlers import register_handlers
 from lottery_bot.storage import StorageManager
 
 
+async def _flush_storage(application: Application) -> None:
+    await application.bot_data["storage"].flush()
+
+
 def main() -> None:
     settings = get_settings()
     storage = StorageManager(
         Path("data/store.json"), total_tickets=settings.total_tickets, default_card_number=settings.card_number
     )
 
-    application = Application.builder().token(settings.bot_token).build()
+    application = Application.builder().token(settings.bot_token).post_shutdown(_flush_storage).build()
     application.bot_data["settings"] = settings
     application.bot_data["storage"] = storage
 